@@ -5,8 +5,14 @@
 import sys
 sys.path.append('.')
 
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+
 from services import audio_simple, video
 import numpy as np
+from scipy.ndimage import maximum_filter1d
 
 
 def analyze_silence_patterns(video_path: str):
@@ -27,11 +33,17 @@ def analyze_silence_patterns(video_path: str):
     # 2. RMS計算
     print('[2/4] RMSエネルギー計算中...')
     times, rms = audio_simple.compute_rms_energy(audio_data, sr, cfg)
+    rms = rms.astype(np.float32, copy=False)  # 振幅包絡線にはfloat32で十分（時刻はfloat64のまま）
     print(f'  RMSフレーム数: {len(rms):,}')
     print()
 
     # 3. RMS統計
-    stats = audio_simple.analyze_audio_statistics(rms)
+    # 統計用と無音閾値用のパーセンタイルを1回の選択でまとめて算出
+    test_percentiles = [20, 25, 30, 35, 40, 45, 50]
+    all_percentiles = sorted(set(audio_simple.STATS_PERCENTILES) | set(test_percentiles))
+    percentile_values = dict(zip(all_percentiles, np.percentile(rms, all_percentiles)))
+
+    stats = audio_simple.analyze_audio_statistics(rms, percentile_values)
     print('[3/4] RMS統計:')
     for key, value in stats.items():
         print(f'  {key}: {value:.6f}')
@@ -42,74 +54,83 @@ def analyze_silence_patterns(video_path: str):
     print()
 
     # 様々な閾値で無音区間を抽出
-    test_percentiles = [20, 25, 30, 35, 40, 45, 50]
-
-    for percentile in test_percentiles:
-        silence_threshold = np.percentile(rms, percentile)
-
-        # 無音区間を抽出（最小持続時間なし）
-        is_silence = rms < silence_threshold
-
-        silence_segments = []
-        in_silence = False
-        silence_start_idx = 0
-
-        for i in range(len(is_silence)):
-            if is_silence[i] and not in_silence:
-                in_silence = True
-                silence_start_idx = i
-            elif not is_silence[i] and in_silence:
-                in_silence = False
-                duration = times[i] - times[silence_start_idx]
-
-                # 無音区間の後の音レベルを取得
-                check_frames = min(20, len(rms) - i)  # 後続1秒間をチェック
-                if check_frames > 0:
-                    resume_peak = np.max(rms[i:i+check_frames])
-                    resume_mean = np.mean(rms[i:i+check_frames])
-
-                    silence_segments.append({
-                        'start': times[silence_start_idx],
-                        'end': times[i],
-                        'duration': duration,
-                        'resume_peak': resume_peak,
-                        'resume_mean': resume_mean,
-                        'ratio_peak': resume_peak / silence_threshold if silence_threshold > 0 else 0,
-                        'ratio_mean': resume_mean / silence_threshold if silence_threshold > 0 else 0
-                    })
+    thresholds = np.array([percentile_values[p] for p in test_percentiles])
+
+    # 各フレームから後続1秒間（20フレーム、終端は切り詰め）の最大・平均を事前計算
+    # 閾値に依存しないため、ファイルごとに1回だけ計算する
+    window = 20
+    roll_max = maximum_filter1d(rms, size=window, origin=-(window // 2), mode='constant', cval=-np.inf)
+    frame_idx = np.arange(len(rms))
+    win_end = np.minimum(frame_idx + window, len(rms))
+    csum = np.concatenate([[0.0], np.cumsum(rms, dtype=np.float64)])
+    roll_mean = (csum[win_end] - csum[:-1]) / (win_end - frame_idx)
+
+    # 全閾値の無音マスクを1回の比較で作成し、立ち上がり/立ち下がりエッジもまとめて検出
+    # （最小持続時間なし、行ごとに1つの閾値）
+    is_silence = rms[np.newaxis, :] < thresholds[:, np.newaxis]
+    edges = np.diff(is_silence.view(np.int8), axis=1, prepend=0, append=0)
+    segment_rows, all_starts = np.nonzero(edges == 1)
+    _, all_ends = np.nonzero(edges == -1)
+
+    # 最後まで無音の区間は後続の音がないため除外
+    closed = all_ends < len(rms)
+    segment_rows = segment_rows[closed]
+    all_starts = all_starts[closed]
+    all_ends = all_ends[closed]
+
+    # 各閾値の区間は行順に並んでいるので、行の境界で切り出す
+    row_bounds = np.searchsorted(segment_rows, np.arange(len(test_percentiles) + 1))
+
+    for k, (percentile, silence_threshold) in enumerate(zip(test_percentiles, thresholds)):
+        starts = all_starts[row_bounds[k]:row_bounds[k + 1]]
+        ends = all_ends[row_bounds[k]:row_bounds[k + 1]]
+
+        durations = times[ends] - times[starts]
+
+        # 無音区間の後の音レベルを取得
+        resume_peaks = roll_max[ends]
+        resume_means = roll_mean[ends]
+
+        # 閾値の逆数を1回だけ求め、区間ごとの比率は乗算で計算
+        inv_th = 1.0 / silence_threshold if silence_threshold > 0 else 0.0
+        ratios_peak = resume_peaks * inv_th
+        ratios_mean = resume_means * inv_th
 
         # 統計分析
-        if len(silence_segments) > 0:
-            durations = [s['duration'] for s in silence_segments]
-            resume_peaks = [s['resume_peak'] for s in silence_segments]
-            ratios_peak = [s['ratio_peak'] for s in silence_segments]
-            ratios_mean = [s['ratio_mean'] for s in silence_segments]
-
+        if len(durations) > 0:
             # 長い無音区間（10秒以上）の抽出
-            long_silence = [s for s in silence_segments if s['duration'] >= 10.0]
+            long_mask = durations >= 10.0
+            long_count = int(np.count_nonzero(long_mask))
 
             print(f'--- 無音閾値 {percentile}%tile (RMS={silence_threshold:.6f}) ---')
-            print(f'  全無音区間数: {len(silence_segments)}')
-            print(f'  無音持続時間: min={min(durations):.1f}s, max={max(durations):.1f}s, mean={np.mean(durations):.1f}s')
-            print(f'  10秒以上の無音: {len(long_silence)}個')
+            print(f'  全無音区間数: {len(durations)}')
+            print(f'  無音持続時間: min={durations.min():.1f}s, max={durations.max():.1f}s, mean={durations.mean():.1f}s')
+            print(f'  10秒以上の無音: {long_count}個')
 
-            if len(long_silence) > 0:
-                long_ratios_peak = [s['ratio_peak'] for s in long_silence]
-                long_ratios_mean = [s['ratio_mean'] for s in long_silence]
+            if long_count > 0:
+                long_ratios_peak = ratios_peak[long_mask]
+                # min/max/中央値/四分位点を1回の選択でまとめて算出
+                p0, p25, p50, p75, p100 = np.percentile(long_ratios_peak, [0, 25, 50, 75, 100])
 
                 print(f'  → 10秒以上無音の後の音レベル比率（ピーク）:')
-                print(f'     min={min(long_ratios_peak):.2f}x, max={max(long_ratios_peak):.2f}x, ')
-                print(f'     mean={np.mean(long_ratios_peak):.2f}x, median={np.median(long_ratios_peak):.2f}x')
-                print(f'     p25={np.percentile(long_ratios_peak, 25):.2f}x, p75={np.percentile(long_ratios_peak, 75):.2f}x')
+                print(f'     min={p0:.2f}x, max={p100:.2f}x, ')
+                print(f'     mean={long_ratios_peak.mean(dtype=np.float64):.2f}x, median={p50:.2f}x')
+                print(f'     p25={p25:.2f}x, p75={p75:.2f}x')
 
                 print(f'  → 10秒以上無音の詳細（最初の5件）:')
-                for i, s in enumerate(long_silence[:5], 1):
-                    print(f'     {i}. {s["start"]:.1f}s-{s["end"]:.1f}s (持続:{s["duration"]:.1f}s, 後の音:{s["ratio_peak"]:.2f}x)')
+                detail = zip(
+                    times[starts[long_mask][:5]],
+                    times[ends[long_mask][:5]],
+                    durations[long_mask][:5],
+                    long_ratios_peak[:5]
+                )
+                for i, (start, end, duration, ratio) in enumerate(detail, 1):
+                    print(f'     {i}. {start:.1f}s-{end:.1f}s (持続:{duration:.1f}s, 後の音:{ratio:.2f}x)')
 
                 # 推奨パラメータ
                 if len(long_ratios_peak) >= 3:
                     # 75%点を推奨値とする（上位25%を無呼吸とみなす）
-                    recommended_ratio = np.percentile(long_ratios_peak, 75)
+                    recommended_ratio = p75
                     print(f'  ★ 推奨パラメータ: 無音閾値={percentile}%tile, 呼吸再開倍率={recommended_ratio:.1f}x')
 
             print()
@@ -119,16 +140,11 @@ def analyze_silence_patterns(video_path: str):
     print('='*60)
 
 
-if __name__ == "__main__":
-    # 3つのサンプルで分析
-    samples = [
-        'tests/test_data/sleep_sample_5min.mp4',
-        'tests/test_data/sleep_sample_1h.mp4',
-        'tests/test_data/sleep_sample_2h.mp4',
-        'tests/test_data/sleep_sample_3h.mp4'
-    ]
+def analyze_sample(sample: str) -> str:
+    """1サンプル分の分析を実行し、出力をまとめて返す（並列実行時に出力が混ざらないように）"""
+    buffer = io.StringIO()
 
-    for sample in samples:
+    with redirect_stdout(buffer):
         print(f'\n\n{"#"*60}')
         print(f'# サンプル: {sample}')
         print(f'{"#"*60}\n')
@@ -137,4 +153,22 @@ if __name__ == "__main__":
             analyze_silence_patterns(sample)
         except Exception as e:
             print(f'エラー: {e}')
-            continue
+
+    return buffer.getvalue()
+
+
+if __name__ == "__main__":
+    # 3つのサンプルで分析
+    samples = [
+        'tests/test_data/sleep_sample_5min.mp4',
+        'tests/test_data/sleep_sample_1h.mp4',
+        'tests/test_data/sleep_sample_2h.mp4',
+        'tests/test_data/sleep_sample_3h.mp4'
+    ]
+
+    # サンプルごとに独立（デコード+NumPy処理）なのでプロセス並列で実行
+    # 出力はサンプルの順に表示する（終わったサンプルから順に表示すると毎回順序が変わる）
+    max_workers = min(len(samples), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for report in executor.map(analyze_sample, samples):
+            print(report, end='')
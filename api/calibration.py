@@ -5,11 +5,17 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException
 from fastapi.responses import FileResponse, Response
 from pydantic import BaseModel
-from typing import List
+from typing import List, Tuple
+import os
+import shutil
 import sys
+import subprocess
+import traceback
 from pathlib import Path
 import numpy as np
+import orjson
 import tempfile
+from scipy.signal import find_peaks
 
 sys.path.append(str(Path(__file__).parent.parent))
 
@@ -19,6 +25,9 @@ from services.storage import Storage
 router = APIRouter(prefix="/calibrate", tags=["calibration"])
 storage = Storage(base_dir="./data")
 
+# 候補抽出のピーク検出パラメータ（最小距離=20フレーム=約1秒）
+_FIND_PEAKS_KW = dict(distance=20, prominence=0.0001)
+
 
 class MarkerInput(BaseModel):
     """マーク入力"""
@@ -32,6 +41,47 @@ class CalculateRequest(BaseModel):
     markers: List[MarkerInput]
 
 
+def _load_rms(job_id: str, results: dict) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    RMS時系列を取得（.npyを優先し、旧形式のジョブはJSONから読み込む）
+
+    Args:
+        job_id: ジョブID
+        results: 解析結果辞書
+
+    Returns:
+        (時刻配列, RMS配列)
+    """
+    rms_data = storage.load_rms(job_id)
+    if rms_data is not None:
+        return rms_data
+
+    rms_full = results["rms_full"]
+    return np.array(rms_full["t"]), np.array(rms_full["y"])
+
+
+_WAVEFORM_POINTS = 4000
+
+
+def _overview_waveform(times: np.ndarray, rms: np.ndarray) -> dict:
+    """
+    全体表示用に間引いた波形を作成（拡大表示・解析にはrms_fullを使用）
+
+    Args:
+        times: RMSフレームの時刻配列
+        rms: RMSエネルギー配列
+
+    Returns:
+        {"t": 時刻配列, "y": RMS配列}（約_WAVEFORM_POINTS点）
+    """
+    stride = max(1, len(rms) // _WAVEFORM_POINTS)
+    # orjsonは連続配列のみシリアライズできるためコピーする
+    return {
+        "t": np.ascontiguousarray(times[::stride]),
+        "y": np.ascontiguousarray(rms[::stride], dtype=np.float32)
+    }
+
+
 @router.post("/analyze")
 async def analyze_for_calibration(file: UploadFile = File(...)):
     """
@@ -40,9 +90,7 @@ async def analyze_for_calibration(file: UploadFile = File(...)):
     """
     try:
         # ファイル保存
-        file_data = await file.read()
-        file_size = len(file_data)
-        job_id, file_path = storage.save_upload(file_data, file.filename)
+        job_id, file_path, file_size, _ = storage.save_upload_stream(file.file, file.filename)
 
         print(f"\n[キャリブレーション] ジョブID: {job_id}")
         print(f"  ファイルサイズ: {file_size / 1024 / 1024:.1f}MB")
@@ -57,6 +105,7 @@ async def analyze_for_calibration(file: UploadFile = File(...)):
         audio_extensions = ['wav', 'mp3', 'm4a', 'aac', 'flac', 'ogg', 'wma', 'opus',
                            'aiff', 'aif']
 
+        metadata = None
         if file_ext in video_extensions:
             # 動画処理パターン
             metadata = video_module.get_video_metadata(file_path)
@@ -71,51 +120,81 @@ async def analyze_for_calibration(file: UploadFile = File(...)):
         else:
             raise HTTPException(status_code=400, detail=f"非対応のファイル形式です: {file_ext}")
 
-        # 音声処理
-        cfg = audio_simple.SimpleAudioConfig()
-        audio_data, sr = audio_simple.load_and_preprocess(file_path, cfg.audio_sr)
-        print(f"  音声サンプル数: {len(audio_data):,}")
-
-        # RMS計算
-        times, rms = audio_simple.compute_rms_energy(audio_data, sr, cfg)
-        print(f"  RMSフレーム数: {len(rms):,}")
-
-        # ダウンサンプリングなし（全データ送信）
-        down_t, down_y = times, rms
-
-        # 音声ファイルを一時保存（再生用）
+        # 再生用の音声ファイルを作成（FFmpegはバックグラウンドで実行し、RMS計算と並行させる）
         audio_path = Path(storage.uploads_dir) / f"{job_id}_audio.wav"
-
-        # FFmpegで音声抽出
-        import subprocess
-        cmd = [
-            'ffmpeg', '-i', file_path,
-            '-vn', '-acodec', 'libmp3lame', '-q:a', '4',
-            '-y', str(audio_path)
-        ]
-        subprocess.run(cmd, capture_output=True, check=True)
+        audio_proc = None
+
+        if file_ext == 'mp3':
+            # MP3はそのまま再生できるので変換せずにリンク
+            try:
+                os.link(file_path, audio_path)
+            except OSError:
+                # ハードリンク非対応のファイルシステム・別デバイスの場合はコピー
+                shutil.copyfile(file_path, audio_path)
+        else:
+            cmd = [
+                'ffmpeg', '-i', file_path,
+                '-vn', '-acodec', 'libmp3lame', '-q:a', '4',
+                '-y', str(audio_path)
+            ]
+            audio_proc = subprocess.Popen(
+                cmd,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL
+            )
+
+        try:
+            # 音声処理
+            cfg = audio_simple.SimpleAudioConfig()
+            audio_data, sr = audio_simple.load_and_preprocess(file_path, cfg.audio_sr)
+            print(f"  音声サンプル数: {len(audio_data):,}")
+
+            # RMS計算
+            times, rms = audio_simple.compute_rms_energy(audio_data, sr, cfg)
+            print(f"  RMSフレーム数: {len(rms):,}")
+        except Exception:
+            if audio_proc is not None:
+                audio_proc.kill()
+                audio_proc.wait()
+            raise
+
+        # RMSは振幅包絡なのでfloat32で十分（転送量を半減）
+        # 時刻は候補・AHIの時刻計算に使うためfloat64のまま
+        rms = rms.astype(np.float32, copy=False)
+
+        # 再生用音声の変換完了を待つ
+        if audio_proc is not None and audio_proc.wait() != 0:
+            raise subprocess.CalledProcessError(audio_proc.returncode, audio_proc.args)
 
         # ジョブ作成
-        storage.create_job(job_id, file_path, "calibration-v1")
+        storage.create_job(job_id, file_path, "calibration-v1", metadata=metadata)
 
-        # RMSデータを保存
+        # RMSデータ（rms_fullはダウンサンプリングなし、waveformは全体表示用の間引き版）
         result_data = {
             "job_id": job_id,
             "duration_sec": duration,
             "sr": sr,
-            "waveform": {
-                "t": down_t.tolist(),
-                "y": down_y.tolist()
-            },
+            "waveform": _overview_waveform(times, rms),
             "rms_full": {
-                "t": times.tolist(),
-                "y": rms.tolist()
+                "t": times,
+                "y": rms
             }
         }
 
-        storage.save_results(job_id, result_data)
+        # RMSはバイナリ、JSONにはメタデータのみ保存
+        storage.save_rms(job_id, times, rms)
+        storage.save_results(job_id, {
+            "job_id": job_id,
+            "duration_sec": duration,
+            "sr": sr
+        })
 
-        return result_data
+        # numpy配列をorjsonで直接シリアライズ（Pythonのfloatリストを経由しない）
+        return Response(
+            content=orjson.dumps(result_data, option=orjson.OPT_SERIALIZE_NUMPY),
+            media_type="application/json"
+        )
 
     except Exception as e:
         print(f"[エラー] {str(e)}")
@@ -146,9 +225,7 @@ async def calculate_parameters(request: CalculateRequest):
         if results is None:
             raise HTTPException(status_code=404, detail="解析結果が見つかりません")
 
-        rms_full = results["rms_full"]
-        times = np.array(rms_full["t"])
-        rms = np.array(rms_full["y"])
+        times, rms = _load_rms(request.job_id, results)
 
         print(f"\n[パラメータ計算] マーク数: {len(request.markers)}")
 
@@ -156,27 +233,24 @@ async def calculate_parameters(request: CalculateRequest):
         silence_values = []
         resume_peaks = []
 
-        for marker in request.markers:
-            start = marker.start
-            end = marker.end
+        # 時刻配列は単調増加なので、二分探索で各マーク区間のインデックス範囲を求める
+        marker_starts = np.array([m.start for m in request.markers])
+        marker_ends = np.array([m.end for m in request.markers])
+        lo_idx = np.searchsorted(times, marker_starts, side="left")
+        hi_idx = np.searchsorted(times, marker_ends, side="right")
+        resume_idx = np.searchsorted(times, marker_ends, side="left")
 
+        for start, end, lo, hi, resume_start in zip(marker_starts, marker_ends, lo_idx, hi_idx, resume_idx):
             # マーク区間内のRMS値を取得
-            mask = (times >= start) & (times <= end)
-            silence_rms = rms[mask]
-
-            if len(silence_rms) > 0:
+            if hi > lo:
                 # 無音区間の平均RMS
-                avg_silence = np.mean(silence_rms)
+                avg_silence = np.mean(rms[lo:hi], dtype=np.float64)
                 silence_values.append(avg_silence)
 
                 # 無音終了後のピーク音（10フレーム = 約0.5秒）
-                end_idx = np.where(times >= end)[0]
-                if len(end_idx) > 0:
-                    start_idx = end_idx[0]
-                    check_frames = min(10, len(rms) - start_idx)
-                    if check_frames > 0:
-                        resume_peak = np.max(rms[start_idx:start_idx+check_frames])
-                        resume_peaks.append(resume_peak)
+                if resume_start < len(rms):
+                    resume_peak = np.max(rms[resume_start:resume_start + 10])
+                    resume_peaks.append(resume_peak)
 
                 print(f"  マーク {start:.1f}s-{end:.1f}s: 無音RMS={avg_silence:.6f}")
 
@@ -189,8 +263,8 @@ async def calculate_parameters(request: CalculateRequest):
 
         # 呼吸再開倍率: 無音閾値に対する再開ピークの比率の平均
         if len(resume_peaks) > 0:
-            ratios = [peak / silence_threshold for peak in resume_peaks]
-            resume_multiplier = float(np.mean(ratios))
+            ratios = np.asarray(resume_peaks) * (1.0 / silence_threshold)
+            resume_multiplier = float(ratios.mean())
         else:
             resume_multiplier = 2.0  # デフォルト
 
@@ -270,9 +344,25 @@ async def load_existing_job(job_id: str):
         results["recording_start_datetime"] = job.get("recording_start_datetime")
         results["time_display_mode"] = job.get("time_display_mode", "relative")
 
+        # 波形データを追加（.npyで保存されたジョブ）
+        if "rms_full" not in results:
+            times, rms = _load_rms(job_id, results)
+            results["rms_full"] = {
+                "t": np.asarray(times),
+                "y": np.asarray(rms, dtype=np.float32)
+            }
+        if "waveform" not in results:
+            rms_full = results["rms_full"]
+            results["waveform"] = _overview_waveform(
+                np.asarray(rms_full["t"]), np.asarray(rms_full["y"])
+            )
+
         print(f"\n[ジョブ再読み込み] ID: {job_id}")
 
-        return results
+        return Response(
+            content=orjson.dumps(results, option=orjson.OPT_SERIALIZE_NUMPY),
+            media_type="application/json"
+        )
 
     except HTTPException:
         raise
@@ -287,6 +377,11 @@ async def delete_job(job_id: str):
     ジョブとその関連ファイルを削除
     """
     try:
+        # 開いたままのフレーム抽出用の動画を閉じてから削除
+        video_path = storage.get_video_path(job_id)
+        if video_path is not None:
+            video_module.release_reader(video_path)
+
         success = storage.delete_job(job_id)
         if not success:
             raise HTTPException(status_code=404, detail="ジョブが見つかりません")
@@ -301,6 +396,50 @@ async def delete_job(job_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _compute_candidates(times: np.ndarray, rms: np.ndarray, top_n: int) -> Tuple[List[dict], np.ndarray, np.ndarray]:
+    """
+    RMSエネルギーのピーク上位N件から候補リストを作成
+
+    Args:
+        times: RMSフレームの時刻配列
+        rms: RMSエネルギー配列
+        top_n: 抽出する候補数
+
+    Returns:
+        (候補ポイントのリスト, 全ピーク位置, 上位N件のピーク位置)
+    """
+    # ピーク検出（局所最大値を探す）
+    peaks, _ = find_peaks(rms, **_FIND_PEAKS_KW)
+
+    # ピーク値で降順ソート
+    peak_values = rms[peaks]
+    sorted_indices = np.argsort(peak_values)[::-1]
+
+    # 上位N件を取得
+    top_peaks = peaks[sorted_indices[:top_n]]
+    top_values = peak_values[sorted_indices[:top_n]]
+
+    # 候補リスト作成（RMSエネルギーが高い順）
+    candidates = []
+    for i, (peak_idx, peak_value) in enumerate(zip(top_peaks, top_values)):
+        peak_time = times[peak_idx]
+
+        # 無呼吸区間の推定（ピークの10秒前〜ピーク直前）
+        apnea_start = max(0, peak_time - 10.0)
+        apnea_end = peak_time
+
+        candidates.append({
+            "id": i,
+            "peak_time": float(peak_time),
+            "peak_rms": float(peak_value),
+            "apnea_start": float(apnea_start),
+            "apnea_end": float(apnea_end),
+            "status": "pending"  # pending, apnea, skip
+        })
+
+    return candidates, peaks, top_peaks
+
+
 @router.post("/extract-candidates")
 async def extract_candidates(job_id: str, top_n: int = 50):
     """
@@ -319,46 +458,18 @@ async def extract_candidates(job_id: str, top_n: int = 50):
         if results is None:
             raise HTTPException(status_code=404, detail="解析結果が見つかりません")
 
-        rms_full = results["rms_full"]
-        times = np.array(rms_full["t"])
-        rms = np.array(rms_full["y"])
+        times, rms = _load_rms(job_id, results)
 
         print(f"\n[候補抽出] ジョブID: {job_id}")
         print(f"  RMSフレーム数: {len(rms):,}")
 
-        # ピーク検出（局所最大値を探す）
-        from scipy.signal import find_peaks
-
-        # ピーク検出（最小距離=20フレーム=約1秒）
-        peaks, properties = find_peaks(rms, distance=20, prominence=0.0001)
-
-        # ピーク値で降順ソート
-        peak_values = rms[peaks]
-        sorted_indices = np.argsort(peak_values)[::-1]
-
-        # 上位N件を取得
-        top_peaks = peaks[sorted_indices[:top_n]]
-        top_values = peak_values[sorted_indices[:top_n]]
+        candidates, peaks, top_peaks = _compute_candidates(times, rms, top_n)
 
-        # 候補リスト作成（RMSエネルギーが高い順）
-        candidates = []
-        for i, (peak_idx, peak_value) in enumerate(zip(top_peaks, top_values)):
-            peak_time = times[peak_idx]
-
-            # 無呼吸区間の推定（ピークの10秒前〜ピーク直前）
-            apnea_start = max(0, peak_time - 10.0)
-            apnea_end = peak_time
-
-            candidates.append({
-                "id": i,
-                "peak_time": float(peak_time),
-                "peak_rms": float(peak_value),
-                "apnea_start": float(apnea_start),
-                "apnea_end": float(apnea_end),
-                "status": "pending"  # pending, apnea, skip
-            })
+        # ピーク位置のみ保存（追加候補抽出で再利用、結果JSONは書き換えない）
+        storage.save_peaks(job_id, peaks, top_peaks)
 
         print(f"  抽出した候補数: {len(candidates)}")
+        top_values = rms[top_peaks]
         print(f"  RMS範囲: {top_values.min():.6f} 〜 {top_values.max():.6f}")
 
         return {
@@ -371,7 +482,6 @@ async def extract_candidates(job_id: str, top_n: int = 50):
         raise
     except Exception as e:
         print(f"[エラー] {str(e)}")
-        import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -542,7 +652,6 @@ async def get_judgment_summary(request: CandidateJudgmentsRequest):
 
     except Exception as e:
         print(f"[エラー] {str(e)}")
-        import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -581,20 +690,23 @@ async def extract_additional_candidates(request: AdditionalCandidatesRequest):
         if results is None:
             raise HTTPException(status_code=404, detail="解析結果が見つかりません")
 
-        rms_full = results["rms_full"]
-        times = np.array(rms_full["t"])
-        rms = np.array(rms_full["y"])
+        times, rms = _load_rms(request.job_id, results)
 
-        # 既存候補を取得（最初の抽出時のもの）
-        existing_response = await extract_candidates(request.job_id, top_n=50)
-        existing_candidates = existing_response["candidates"]
-        existing_peak_times = set(c["peak_time"] for c in existing_candidates)
+        # 既存候補のピーク位置を取得（最初の抽出時に保存したもの）
+        saved_peaks = storage.load_peaks(request.job_id)
+        if saved_peaks is not None:
+            peaks, existing_top_indices = saved_peaks
+        else:
+            _, peaks, existing_top_indices = _compute_candidates(times, rms, 50)
+            storage.save_peaks(request.job_id, peaks, existing_top_indices)
 
         # 参照候補（無呼吸判定されたもの）のRMS値を取得
-        reference_rms_values = []
-        for cand in existing_candidates:
-            if cand["id"] in request.reference_candidate_ids:
-                reference_rms_values.append(cand["peak_rms"])
+        reference_ids = set(request.reference_candidate_ids)
+        reference_rms_values = [
+            rms[peak_idx]
+            for cand_id, peak_idx in enumerate(existing_top_indices)
+            if cand_id in reference_ids
+        ]
 
         if len(reference_rms_values) == 0:
             raise HTTPException(status_code=400, detail="無呼吸判定された候補がありません")
@@ -610,48 +722,37 @@ async def extract_additional_candidates(request: AdditionalCandidatesRequest):
         print(f"  平均RMS: {mean_rms:.6f}, 標準偏差: {std_rms:.6f}")
         print(f"  抽出範囲: {lower_bound:.6f} 〜 {upper_bound:.6f}")
 
-        # ピーク検出
-        from scipy.signal import find_peaks
-        peaks, properties = find_peaks(rms, distance=20, prominence=0.0001)
-
-        # 範囲内のピークを抽出
-        additional_candidates = []
-        for peak_idx in peaks:
-            peak_time = times[peak_idx]
-            peak_rms = rms[peak_idx]
-
-            # 既存候補に含まれていないかチェック
-            if peak_time in existing_peak_times:
-                continue
-
-            # RMS範囲チェック
-            if lower_bound <= peak_rms <= upper_bound:
-                # 信頼度スコア（中心からの距離が近いほど高い）
-                distance_from_mean = abs(peak_rms - mean_rms)
-                confidence = 1.0 - (distance_from_mean / (request.sigma_range * std_rms))
-
-                apnea_start = max(0, peak_time - 10.0)
-                apnea_end = peak_time
+        # 範囲内かつ既存候補に含まれないピークを抽出
+        # （既存候補はpeaksの部分集合なので、昇順のpeaksを二分探索して除外位置を求める）
+        peak_rms_all = rms[peaks]
+        keep = (peak_rms_all >= lower_bound) & (peak_rms_all <= upper_bound)
+        keep[np.searchsorted(peaks, existing_top_indices)] = False
+        kept_peaks = peaks[keep]
+        kept_rms = peak_rms_all[keep]
 
-                additional_candidates.append({
-                    "peak_time": float(peak_time),
-                    "peak_rms": float(peak_rms),
-                    "confidence": float(confidence),
-                    "apnea_start": float(apnea_start),
-                    "apnea_end": float(apnea_end)
-                })
+        # 信頼度スコア（中心からの距離が近いほど高い）
+        confidence = 1.0 - np.abs(kept_rms - mean_rms) / (request.sigma_range * std_rms)
 
-        # 信頼度順にソート
-        additional_candidates.sort(key=lambda x: x["confidence"], reverse=True)
-
-        # 最大数まで取得
-        additional_candidates = additional_candidates[:request.max_candidates]
+        # 信頼度順にソートし、最大数まで取得
+        order = np.argsort(-confidence, kind="stable")[:request.max_candidates]
+        kept_times = times[kept_peaks[order]]
 
         # IDを割り当て（既存候補の続きから）
-        start_id = len(existing_candidates)
-        for i, cand in enumerate(additional_candidates):
-            cand["id"] = start_id + i
-            cand["status"] = "pending"
+        start_id = len(existing_top_indices)
+        additional_candidates = [
+            {
+                "peak_time": float(peak_time),
+                "peak_rms": float(peak_rms),
+                "confidence": float(conf),
+                "apnea_start": float(max(0, peak_time - 10.0)),
+                "apnea_end": float(peak_time),
+                "id": start_id + i,
+                "status": "pending"
+            }
+            for i, (peak_time, peak_rms, conf) in enumerate(
+                zip(kept_times, kept_rms[order], confidence[order])
+            )
+        ]
 
         print(f"  抽出した追加候補数: {len(additional_candidates)}")
 
@@ -672,7 +773,6 @@ async def extract_additional_candidates(request: AdditionalCandidatesRequest):
         raise
     except Exception as e:
         print(f"[エラー] {str(e)}")
-        import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -733,29 +833,30 @@ async def calculate_ahi(request: AHICalculationRequest):
             overall_ahi = len(event_times) / (total_duration / 3600)
             print(f"  全体AHI: {overall_ahi:.1f} (録音時間が1時間未満)")
         else:
-            # スライディングウィンドウで計算
-            current_time = 0
-            while current_time + window_size <= total_duration:
-                window_start = current_time
-                window_end = current_time + window_size
-
-                # この窓内のイベント数をカウント
-                events_in_window = np.sum((event_times >= window_start) & (event_times < window_end))
-                ahi = float(events_in_window)  # 1時間窓なのでそのままAHI
-
-                ahi_timeline.append({
+            # スライディングウィンドウで計算（録音内に収まる窓のみ）
+            window_count = int((total_duration - window_size) // step_size) + 1
+            window_starts = np.arange(window_count) * step_size
+            window_ends = window_starts + window_size
+
+            # ソート済みイベント時刻を二分探索し、各窓内のイベント数を一括カウント
+            left = np.searchsorted(event_times, window_starts, side="left")
+            right = np.searchsorted(event_times, window_ends, side="left")
+            ahi_values = (right - left).astype(float)  # 1時間窓なのでそのままAHI
+
+            ahi_timeline = [
+                {
                     "time": float(window_start),
-                    "ahi": ahi,
+                    "ahi": float(ahi),
                     "window_start": float(window_start),
                     "window_end": float(window_end)
-                })
-
-                # 最大AHI更新
-                if ahi > max_ahi:
-                    max_ahi = ahi
-                    worst_period_start = window_start
+                }
+                for window_start, window_end, ahi in zip(window_starts, window_ends, ahi_values)
+            ]
 
-                current_time += step_size
+            # 最大AHI（同値の場合は最も早い窓）
+            worst_idx = int(np.argmax(ahi_values))
+            max_ahi = float(ahi_values[worst_idx])
+            worst_period_start = int(window_starts[worst_idx])
 
             # 全体のAHI（総イベント数 / 総時間）
             overall_ahi = len(event_times) / (total_duration / 3600)
@@ -806,6 +907,5 @@ async def calculate_ahi(request: AHICalculationRequest):
         raise
     except Exception as e:
         print(f"[エラー] {str(e)}")
-        import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
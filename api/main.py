@@ -4,14 +4,22 @@ FastAPI メインアプリケーション
 from fastapi import FastAPI, UploadFile, File, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
+import asyncio
+import functools
+import orjson
+import os
 import sys
+import threading
+import traceback
 
 # モジュールパスを追加
 sys.path.append(str(Path(__file__).parent.parent))
 
-from services.analyzer import analyze, AnalysisConfig
+from services.analyzer import analyze, AnalysisConfig, VIDEO_EXTENSIONS
 from services.storage import Storage
 from services import video as video_module
 from api.schemas import AnalyzeResponse, ResultsResponse, JobResponse
@@ -34,6 +42,28 @@ app.add_middleware(
 # ストレージ初期化
 storage = Storage(base_dir="./data")
 
+# 解析ワーカー（CPU負荷の高い解析をイベントループから切り離す）
+EXECUTOR = ProcessPoolExecutor(max_workers=os.cpu_count())
+_EXECUTOR_LOCK = threading.Lock()
+
+# ファイルI/O・フレームデコード用スレッドプール（ブロッキング処理でイベントループを止めない）
+IO_EXECUTOR = ThreadPoolExecutor(max_workers=2 * (os.cpu_count() or 1))
+
+
+async def _run_blocking(func, *args):
+    """
+    ブロッキング関数をI/Oスレッドプールで実行
+
+    Args:
+        func: 実行する関数
+        *args: 関数の引数
+
+    Returns:
+        関数の戻り値
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(IO_EXECUTOR, func, *args)
+
 # 静的ファイル配信
 web_dir = Path(__file__).parent.parent / "web"
 if web_dir.exists():
@@ -65,45 +95,150 @@ async def health():
     return {"status": "healthy"}
 
 
-@app.post("/analyze", response_model=AnalyzeResponse)
-async def analyze_video(file: UploadFile = File(...)):
+def _run_analysis(job_id: str, file_path: str, cfg: AnalysisConfig, metadata: dict = None):
     """
-    動画を解析
+    解析を実行して結果を保存（ワーカープロセスで実行）
 
     Args:
-        file: アップロードされた動画ファイル
-
-    Returns:
-        解析結果
+        job_id: ジョブID
+        file_path: 動画ファイルパス
+        cfg: 解析設定
+        metadata: アップロード時に取得した動画メタデータ（音声ファイルの場合はNone）
     """
     try:
-        # ファイル保存
-        file_data = await file.read()
-        job_id, file_path = storage.save_upload(file_data, file.filename)
-
-        # ジョブ作成
-        cfg = AnalysisConfig()
-        storage.create_job(job_id, file_path, cfg.version)
-
-        # 解析実行
         print(f"\n{'='*60}")
         print(f"[ジョブ開始] ID: {job_id}")
-        print(f"[ファイル] {file.filename}")
         print(f"{'='*60}\n")
 
-        results = analyze(file_path, cfg)
+        results = analyze(file_path, cfg, metadata)
 
-        # 結果保存
+        # 結果保存（ステータスはcompletedになる）
         storage.save_results(job_id, results.to_dict())
 
         print(f"\n{'='*60}")
         print(f"[ジョブ完了] ID: {job_id}")
         print(f"{'='*60}\n")
 
+    except Exception as e:
+        print(f"[エラー] ジョブ {job_id}: {str(e)}")
+        traceback.print_exc()
+        storage.update_job_status(job_id, "failed")
+
+
+def _submit_analysis(*args):
+    """
+    解析ジョブをワーカープールに投入
+
+    ワーカープロセスが異常終了するとプールは以降の投入をすべて拒否するため、
+    BrokenProcessPoolの場合はプールを作り直して1度だけ再投入する。
+
+    Args:
+        *args: _run_analysisの引数
+
+    Returns:
+        解析ジョブのFuture
+    """
+    global EXECUTOR
+
+    executor = EXECUTOR
+    try:
+        return executor.submit(_run_analysis, *args)
+    except BrokenProcessPool:
+        with _EXECUTOR_LOCK:
+            # 他のリクエストが既に作り直していればそのプールを使う
+            if EXECUTOR is executor:
+                print("[エラー] ワーカープールが停止したため再作成します")
+                EXECUTOR = ProcessPoolExecutor(max_workers=os.cpu_count())
+                executor.shutdown(wait=False)
+            executor = EXECUTOR
+
+    return executor.submit(_run_analysis, *args)
+
+
+def _on_analysis_done(job_id: str, future):
+    """
+    ワーカーの終了時に呼ばれるコールバック
+
+    ワーカープロセスの異常終了などで_run_analysis内の例外処理が働かなかった場合に、
+    ジョブが"running"のまま残らないよう失敗にする。
+
+    Args:
+        job_id: ジョブID
+        future: 解析ジョブのFuture
+    """
+    if future.cancelled():
+        reason = "cancelled"
+    elif future.exception() is not None:
+        reason = str(future.exception())
+    else:
+        return
+
+    print(f"[エラー] ジョブ {job_id}: ワーカーが異常終了しました ({reason})")
+    try:
+        storage.update_job_status(job_id, "failed")
+    except Exception as e:
+        print(f"[エラー] ジョブ {job_id} のステータス更新に失敗: {str(e)}")
+
+
+@app.post("/analyze", response_model=AnalyzeResponse)
+async def analyze_video(file: UploadFile = File(...)):
+    """
+    動画を解析
+
+    解析はワーカープロセスで実行し、job_idをすぐに返す。
+    結果は /results?job_id= をポーリングして取得する。
+
+    Args:
+        file: アップロードされた動画ファイル
+
+    Returns:
+        ジョブID（解析済みファイルの場合は解析結果も含む）
+    """
+    try:
+        # ファイル保存（チャンク単位で書き込みながらハッシュを計算）
+        job_id, file_path, file_size, file_hash = await _run_blocking(
+            storage.save_upload_stream, file.file, file.filename
+        )
+        cfg = AnalysisConfig()
+
+        # 同じ内容のファイルが解析済みなら結果を再利用
+        cached_job_id = await _run_blocking(storage.find_by_hash, file_hash, cfg.version)
+        if cached_job_id is not None:
+            cached_results = await _run_blocking(storage.load_results, cached_job_id)
+            if cached_results is not None:
+                print(f"\n[キャッシュ] 解析済みのファイルです ID: {cached_job_id}")
+                await _run_blocking(os.remove, file_path)
+                return AnalyzeResponse(
+                    job_id=cached_job_id,
+                    status="completed",
+                    results=cached_results
+                )
+
+        # 動画メタデータはアップロード時に1度だけ取得してジョブに保存
+        metadata = None
+        if Path(file_path).suffix.lower().lstrip('.') in VIDEO_EXTENSIONS:
+            metadata = await _run_blocking(video_module.get_video_metadata, file_path)
+
+        # ジョブ作成
+        await _run_blocking(
+            functools.partial(storage.create_job, file_size=file_size, file_hash=file_hash, metadata=metadata),
+            job_id, file_path, cfg.version
+        )
+
+        # 解析をワーカーに投入（完了は待たない）
+        print(f"[ファイル] {file.filename}")
+        await _run_blocking(storage.update_job_status, job_id, "running")
+        try:
+            future = _submit_analysis(job_id, file_path, cfg, metadata)
+        except Exception:
+            await _run_blocking(storage.update_job_status, job_id, "failed")
+            raise
+        future.add_done_callback(functools.partial(_on_analysis_done, job_id))
+
         return AnalyzeResponse(
             job_id=job_id,
-            status="completed",
-            results=results.to_dict()
+            status="running",
+            results=None
         )
 
     except Exception as e:
@@ -120,14 +255,45 @@ async def get_results(job_id: str):
         job_id: ジョブID
 
     Returns:
-        解析結果
+        解析結果（解析中の場合は202とステータス）
     """
-    results = storage.load_results(job_id)
+    results = await _run_blocking(storage.load_results, job_id)
 
     if results is None:
-        raise HTTPException(status_code=404, detail="Results not found")
+        job = await _run_blocking(storage.get_job, job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Results not found")
+        if job["status"] == "failed":
+            raise HTTPException(status_code=500, detail="Analysis failed")
+        if job["status"] == "completed":
+            # 結果ファイルはDBのコミット直後に置き換えるため、読み直してから判定
+            results = await _run_blocking(storage.load_results, job_id)
+            if results is None:
+                raise HTTPException(status_code=500, detail="Results file missing")
+        else:
+            return JSONResponse(status_code=202, content={"job_id": job_id, "status": job["status"]})
+
+    return Response(content=orjson.dumps(results), media_type="application/json")
+
+
+def _extract_jpeg(video_path: str, t: float):
+    """
+    指定時刻のフレームを抽出してJPEGにエンコード
+
+    Args:
+        video_path: 動画ファイルパス
+        t: 時刻 (秒)
+
+    Returns:
+        JPEGバイト列、フレームが取得できない場合はNone
+    """
+    frame = video_module.extract_frame_at_time(video_path, t)
+
+    if frame is None:
+        return None
 
-    return results
+    # JPEGエンコード
+    return video_module.encode_frame_to_jpeg(frame, quality=85)
 
 
 @app.get("/frame")
@@ -142,19 +308,16 @@ async def get_frame(job_id: str, t: float):
     Returns:
         JPEG画像
     """
-    video_path = storage.get_video_path(job_id)
+    video_path = await _run_blocking(storage.get_video_path, job_id)
 
     if video_path is None:
         raise HTTPException(status_code=404, detail="Job not found")
 
-    frame = video_module.extract_frame_at_time(video_path, t)
+    jpeg_bytes = await _run_blocking(_extract_jpeg, video_path, t)
 
-    if frame is None:
+    if jpeg_bytes is None:
         raise HTTPException(status_code=404, detail="Frame not found")
 
-    # JPEGエンコード
-    jpeg_bytes = video_module.encode_frame_to_jpeg(frame, quality=85)
-
     return Response(content=jpeg_bytes, media_type="image/jpeg")
 
 
@@ -170,14 +333,13 @@ async def download_results(job_id: str, fmt: str = "json"):
     Returns:
         ファイル
     """
-    results = storage.load_results(job_id)
+    results = await _run_blocking(storage.load_results, job_id)
 
     if results is None:
         raise HTTPException(status_code=404, detail="Results not found")
 
     if fmt == "json":
-        import json
-        content = json.dumps(results, ensure_ascii=False, indent=2)
+        content = orjson.dumps(results, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
         media_type = "application/json"
         filename = f"{job_id}_results.json"
 
@@ -194,21 +356,23 @@ async def download_results(job_id: str, fmt: str = "json"):
 
         # サマリ
         summary = results.get("summary", {})
-        for key, value in summary.items():
-            if key != "説明":
-                writer.writerow([key, value])
+        writer.writerows(
+            (key, value) for key, value in summary.items() if key != "説明"
+        )
 
-        # イベント
+        # イベント（writerowsでまとめて書き込み）
         writer.writerow([])
         writer.writerow(["イベント種別", "開始時刻", "終了時刻", "信頼度/レベル"])
 
-        for event in results.get("events", []):
-            writer.writerow([
+        writer.writerows(
+            (
                 event["type"],
                 event["start"],
                 event["end"],
                 event.get("confidence", event.get("level", ""))
-            ])
+            )
+            for event in results.get("events", [])
+        )
 
         content = output.getvalue()
         media_type = "text/csv"
@@ -235,7 +399,7 @@ async def list_jobs(limit: int = 10):
     Returns:
         ジョブリスト
     """
-    jobs = storage.list_jobs(limit=limit)
+    jobs = await _run_blocking(storage.list_jobs, limit)
     return {"jobs": jobs}
 
 
@@ -3,12 +3,19 @@
 音声処理のみを使用した無呼吸検出のメインロジック
 メモリ効率を重視し、STFT・動画処理を削除
 """
-from typing import Dict, List
+from typing import Dict, List, Optional
 from . import audio_simple
 from . import video
 from . import metrics
 
 
+# 対応ファイル形式（拡張子）
+VIDEO_EXTENSIONS = ['mp4', 'mov', 'avi', 'mkv', 'flv', 'wmv', 'webm', 'm4v',
+                    '3gp', 'mpg', 'mpeg', 'ogv']
+AUDIO_EXTENSIONS = ['wav', 'mp3', 'm4a', 'aac', 'flac', 'ogg', 'wma', 'opus',
+                    'aiff', 'aif']
+
+
 class AnalysisConfig:
     """解析設定"""
     def __init__(self):
@@ -42,13 +49,14 @@ class AnalysisResults:
         }
 
 
-def analyze(video_path: str, cfg: AnalysisConfig = None) -> AnalysisResults:
+def analyze(video_path: str, cfg: AnalysisConfig = None, metadata: Optional[Dict] = None) -> AnalysisResults:
     """
     動画・音声ファイルを解析し、無呼吸検出結果を返す
 
     Args:
         video_path: 動画・音声ファイルパス
         cfg: 解析設定
+        metadata: キャッシュ済みの動画メタデータ（Noneの場合は動画から取得）
 
     Returns:
         解析結果
@@ -63,18 +71,14 @@ def analyze(video_path: str, cfg: AnalysisConfig = None) -> AnalysisResults:
     import os
     file_ext = os.path.splitext(video_path)[1].lower().lstrip('.')
 
-    video_extensions = ['mp4', 'mov', 'avi', 'mkv', 'flv', 'wmv', 'webm', 'm4v',
-                       '3gp', 'mpg', 'mpeg', 'ogv']
-    audio_extensions = ['wav', 'mp3', 'm4a', 'aac', 'flac', 'ogg', 'wma', 'opus',
-                       'aiff', 'aif']
-
     # 1. メタデータ取得（ファイルタイプで分岐）
-    if file_ext in video_extensions:
+    if file_ext in VIDEO_EXTENSIONS:
         print("[解析開始] 動画メタデータを取得中...")
-        metadata = video.get_video_metadata(video_path)
+        if metadata is None:
+            metadata = video.get_video_metadata(video_path)
         results.duration_sec = metadata["duration"]
         print(f"  動画長: {results.duration_sec:.1f}秒 ({metadata['duration']/60:.1f}分)")
-    elif file_ext in audio_extensions:
+    elif file_ext in AUDIO_EXTENSIONS:
         print("[解析開始] 音声メタデータを取得中...")
         results.duration_sec = audio_simple.get_audio_duration(video_path)
         print(f"  音声長: {results.duration_sec:.1f}秒 ({results.duration_sec/60:.1f}分)")
@@ -117,9 +121,10 @@ def analyze(video_path: str, cfg: AnalysisConfig = None) -> AnalysisResults:
 
     # 7. 全RMSデータを保存（キャリブレーション用）
     print("[データ保存] 全RMSデータを保存中...")
+    # numpy配列のまま保持し、保存・レスポンス時にorjsonで直接シリアライズする
     results.rms_full = {
-        "t": rms_t.tolist(),
-        "y": rms.tolist()
+        "t": rms_t,
+        "y": rms
     }
 
     # 8. 波形ダウンサンプリング (プロット用)
@@ -135,9 +140,10 @@ def analyze(video_path: str, cfg: AnalysisConfig = None) -> AnalysisResults:
         down_t = rms_t
         down_y = rms
 
+    # 間引きスライスは非連続なのでコピーして連続配列にする（orjsonの要件）
     results.waveform_downsampled = {
-        "t": down_t.tolist(),
-        "y": down_y.tolist()
+        "t": np.ascontiguousarray(down_t),
+        "y": np.ascontiguousarray(down_y)
     }
 
     print(f"[解析完了] 無呼吸 {summary['apnea_count']} 回")
@@ -7,8 +7,8 @@ import librosa
 import soundfile as sf
 from scipy import signal
 from scipy.fft import fft
+from functools import lru_cache
 from typing import Tuple, Dict, List
-import tempfile
 import subprocess
 
 
@@ -25,6 +25,21 @@ class AudioConfig:
         self.highpass_cutoff = 80  # ハイパスフィルタカットオフ (Hz)
 
 
+@lru_cache(maxsize=None)
+def _butter_sos(cutoff, btype: str) -> np.ndarray:
+    """
+    4次バターワースフィルタを二次セクション(SOS)形式で設計（同じ条件は再設計しない）
+
+    Args:
+        cutoff: 正規化カットオフ周波数（帯域通過の場合は(低域, 高域)のタプル）
+        btype: フィルタ種別 ('high', 'band' など)
+
+    Returns:
+        SOS係数配列
+    """
+    return signal.butter(4, cutoff, btype=btype, output='sos')
+
+
 def load_and_preprocess(video_path: str, target_sr: int = 16000) -> Tuple[np.ndarray, int]:
     """
     動画から音声を抽出し、前処理を実行
@@ -36,30 +51,32 @@ def load_and_preprocess(video_path: str, target_sr: int = 16000) -> Tuple[np.nda
     Returns:
         (音声データ, サンプリングレート)
     """
-    # FFmpegで動画から音声を抽出
-    with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as tmp_audio:
-        tmp_path = tmp_audio.name
-
+    # FFmpegで動画から音声を抽出し、PCMを標準出力から直接読み込む（一時ファイルなし）
     cmd = [
-        'ffmpeg', '-i', video_path,
+        'ffmpeg', '-loglevel', 'error',
+        '-i', video_path,
         '-vn',  # ビデオなし
+        '-f', 's16le',
         '-acodec', 'pcm_s16le',
         '-ar', str(target_sr),
         '-ac', '1',  # モノラル
-        '-y',
-        tmp_path
+        '-'
     ]
 
-    subprocess.run(cmd, capture_output=True, check=True)
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if proc.returncode != 0:
+        # FFmpegのエラー内容（ファイルなし・音声トラックなし等）をそのまま伝える
+        stderr = proc.stderr.decode(errors="replace").strip()
+        raise RuntimeError(f"FFmpeg failed to extract audio from {video_path}: {stderr}")
 
-    # 音声読み込み
-    audio, sr = librosa.load(tmp_path, sr=target_sr, mono=True)
+    # 16bit PCM → float32 [-1, 1)
+    audio = np.frombuffer(proc.stdout, dtype=np.int16).astype(np.float32) * (1.0 / 32768.0)
+    sr = target_sr
 
     # ハイパスフィルタ (低周波ノイズ除去)
     nyquist = sr / 2
     cutoff = 80 / nyquist
-    b, a = signal.butter(4, cutoff, btype='high')
-    audio = signal.filtfilt(b, a, audio)
+    audio = signal.sosfiltfilt(_butter_sos(cutoff, 'high'), audio).astype(np.float32, copy=False)
 
     # 振幅正規化
     max_val = np.max(np.abs(audio))
@@ -98,7 +115,7 @@ def short_time_rms(audio: np.ndarray, sr: int, cfg: AudioConfig) -> Tuple[np.nda
         hop_length=hop_length
     )
 
-    return times, rms
+    return times, rms.astype(np.float32, copy=False)
 
 
 def band_energy(audio: np.ndarray, sr: int, bands: List[Tuple[int, int]], cfg: AudioConfig) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
@@ -118,8 +135,10 @@ def band_energy(audio: np.ndarray, sr: int, bands: List[Tuple[int, int]], cfg: A
     n_fft = 2048
 
     # STFT (短時間フーリエ変換)
-    stft = librosa.stft(audio, n_fft=n_fft, hop_length=hop_length)
-    magnitude = np.abs(stft)
+    stft = librosa.stft(audio, n_fft=n_fft, hop_length=hop_length, dtype=np.complex64)
+    # 実部・虚部から直接float32の振幅を計算し、複素配列はすぐに解放
+    magnitude = np.hypot(stft.real, stft.imag, dtype=np.float32)
+    del stft
 
     # 周波数配列
     freqs = librosa.fft_frequencies(sr=sr, n_fft=n_fft)
@@ -131,14 +150,16 @@ def band_energy(audio: np.ndarray, sr: int, bands: List[Tuple[int, int]], cfg: A
         hop_length=hop_length
     )
 
-    result = {}
-    for low, high in bands:
-        # 帯域内の周波数インデックスを取得
-        band_indices = np.where((freqs >= low) & (freqs <= high))[0]
+    # 帯域フィルタ行列 (帯域数 × 周波数ビン数、帯域内の周波数は1)
+    band_matrix = np.zeros((len(bands), len(freqs)), dtype=np.float32)
+    for k, (low, high) in enumerate(bands):
+        band_matrix[k, (freqs >= low) & (freqs <= high)] = 1.0
 
-        # 帯域エネルギー (帯域内の周波数成分の合計)
-        band_power = np.sum(magnitude[band_indices, :], axis=0)
+    # 帯域エネルギー (帯域内の周波数成分の合計) を全帯域まとめて1回の行列積で計算
+    band_powers = band_matrix @ magnitude.astype(np.float32, copy=False)
 
+    result = {}
+    for (low, high), band_power in zip(bands, band_powers):
         band_name = f"{low}-{high}"
         result[band_name] = (times, band_power)
 
@@ -163,8 +184,7 @@ def breath_cycle_strength(audio: np.ndarray, sr: int, cfg: AudioConfig) -> Tuple
     nyquist = sr / 2
     low_cut = cfg.breath_band[0] / nyquist
     high_cut = cfg.breath_band[1] / nyquist
-    b, a = signal.butter(4, [low_cut, high_cut], btype='band')
-    breath_audio = signal.filtfilt(b, a, audio)
+    breath_audio = signal.sosfiltfilt(_butter_sos((low_cut, high_cut), 'band'), audio).astype(np.float32, copy=False)
 
     # 短時間エネルギーの変動を周期強度として使用（軽量版）
     rms = librosa.feature.rms(
@@ -180,36 +200,88 @@ def breath_cycle_strength(audio: np.ndarray, sr: int, cfg: AudioConfig) -> Tuple
     )
 
     # RMSの標準偏差を周期強度として使用（変動が少ない=無呼吸の可能性）
-    # 移動窓で標準偏差を計算
-    window_size = 30  # 約3秒分のフレーム
-    cycle_strength = np.zeros_like(rms)
-
-    for i in range(len(rms)):
-        start_idx = max(0, i - window_size // 2)
-        end_idx = min(len(rms), i + window_size // 2)
-        cycle_strength[i] = np.std(rms[start_idx:end_idx])
+    cycle_strength = _rolling_std(rms, window_size=30)  # 約3秒分のフレーム
 
     return times, cycle_strength
 
 
+def _rolling_std(x: np.ndarray, window_size: int) -> np.ndarray:
+    """
+    移動窓の標準偏差を計算（累積和から窓ごとの平均・二乗平均を求める）
+
+    各要素iの窓は [i - window_size // 2, i + window_size // 2) で、端では切り詰める。
+
+    Args:
+        x: 入力配列
+        window_size: 窓サイズ (フレーム数)
+
+    Returns:
+        標準偏差配列 (入力と同じdtype)
+    """
+    n = len(x)
+    idx = np.arange(n)
+    start_idx = np.maximum(0, idx - window_size // 2)
+    end_idx = np.minimum(n, idx + window_size // 2)
+    count = end_idx - start_idx
+
+    x64 = x.astype(np.float64)
+    cs1 = np.concatenate([[0.0], np.cumsum(x64)])
+    cs2 = np.concatenate([[0.0], np.cumsum(x64 * x64)])
+    mean = (cs1[end_idx] - cs1[start_idx]) / count
+    mean_sq = (cs2[end_idx] - cs2[start_idx]) / count
+    return np.sqrt(np.maximum(mean_sq - mean * mean, 0.0)).astype(x.dtype)
+
+
+def _pct(a: np.ndarray, p: float) -> float:
+    """
+    パーセンタイル値を選択アルゴリズムで取得（補間なしの順位ベース）
+
+    Args:
+        a: 値配列
+        p: パーセンタイル (0〜100)
+
+    Returns:
+        p%点の値
+    """
+    k = min(int(len(a) * p / 100), len(a) - 1)
+    return np.partition(a, k)[k]
+
+
+def _find_runs(mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    真偽配列の連続したTrue区間を検出
+
+    Args:
+        mask: 真偽配列
+
+    Returns:
+        (開始インデックス配列, 終了インデックス配列)
+        終了インデックスは区間直後のフレーム（最後まで続く区間はlen(mask)）
+    """
+    edges = np.diff(mask.astype(np.int8), prepend=0, append=0)
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    return starts, ends
+
+
 def detect_apnea_candidates(
     rms_t: np.ndarray,
     rms: np.ndarray,
-    breath_energy_t: np.ndarray,
     breath_energy: np.ndarray,
-    cycle_t: np.ndarray,
     cycle_strength: np.ndarray,
     cfg: AudioConfig
 ) -> List[Dict]:
     """
     無呼吸候補を検出
 
+    RMS・呼吸帯域エネルギー・呼吸周期強度は同じホップ長の時間軸で
+    計算されている前提で、補間は行わない（short_time_rms / band_energy /
+    breath_cycle_strength はいずれも中央揃えのフレームで同じ時刻配列になる）。
+
     Args:
         rms_t: RMS時刻配列
         rms: RMS配列
-        breath_energy_t: 呼吸帯域エネルギー時刻配列
         breath_energy: 呼吸帯域エネルギー配列
-        cycle_t: 呼吸周期強度時刻配列
         cycle_strength: 呼吸周期強度配列
         cfg: 設定
 
@@ -217,66 +289,40 @@ def detect_apnea_candidates(
         [{"start": 開始時刻, "end": 終了時刻, "confidence": 信頼度}, ...]
     """
     # RMS閾値を自動計算
-    rms_threshold = np.percentile(rms, cfg.rms_threshold_percentile)
+    rms_threshold = _pct(rms, cfg.rms_threshold_percentile)
 
     # 呼吸エネルギー閾値
-    breath_threshold = np.percentile(breath_energy, cfg.rms_threshold_percentile)
+    breath_threshold = _pct(breath_energy, cfg.rms_threshold_percentile)
 
     # 周期強度閾値
-    cycle_threshold = np.percentile(cycle_strength, 30)
+    cycle_threshold = _pct(cycle_strength, 30)
 
-    # RMSを時系列でスキャンし、低エネルギー区間を検出
-    is_low_energy = (rms < rms_threshold)
+    # フレーミングの違いで末尾が数フレームずれる場合は共通の長さに揃える
+    n = min(len(rms), len(breath_energy), len(cycle_strength))
+    rms_t = rms_t[:n]
 
-    # 呼吸エネルギーも低い区間
-    # 時刻を合わせるため、補間
-    breath_interp = np.interp(rms_t, breath_energy_t, breath_energy)
-    is_low_breath = (breath_interp < breath_threshold)
-
-    # 周期強度も低い区間
-    cycle_interp = np.interp(rms_t, cycle_t, cycle_strength)
-    is_low_cycle = (cycle_interp < cycle_threshold)
-
-    # 3つの条件を組み合わせて無呼吸候補を判定
-    is_apnea = is_low_energy & is_low_breath & is_low_cycle
+    # 3つの条件（低エネルギー・低呼吸エネルギー・低周期強度）を組み合わせて無呼吸候補を判定
+    is_apnea = (
+        (rms[:n] < rms_threshold)
+        & (breath_energy[:n] < breath_threshold)
+        & (cycle_strength[:n] < cycle_threshold)
+    )
 
-    # 連続区間を検出
-    candidates = []
-    in_apnea = False
-    start_idx = 0
-
-    for i in range(len(is_apnea)):
-        if is_apnea[i] and not in_apnea:
-            # 無呼吸開始
-            in_apnea = True
-            start_idx = i
-        elif not is_apnea[i] and in_apnea:
-            # 無呼吸終了
-            in_apnea = False
-            start_t = rms_t[start_idx]
-            end_t = rms_t[i]
-            duration = end_t - start_t
-
-            # 最小持続時間チェック
-            if duration >= cfg.apnea_min_duration:
-                confidence = 0.5  # 基本信頼度
-                candidates.append({
-                    "start": float(start_t),
-                    "end": float(end_t),
-                    "confidence": confidence
-                })
-
-    # 最後まで無呼吸状態の場合
-    if in_apnea:
-        start_t = rms_t[start_idx]
-        end_t = rms_t[-1]
-        duration = end_t - start_t
-        if duration >= cfg.apnea_min_duration:
-            candidates.append({
-                "start": float(start_t),
-                "end": float(end_t),
-                "confidence": 0.5
-            })
+    # 連続区間を検出（最後まで無呼吸状態の場合は最終フレームで終了とする）
+    starts, ends = _find_runs(is_apnea)
+    start_ts = rms_t[starts]
+    end_ts = rms_t[np.minimum(ends, len(rms_t) - 1)]
+
+    # 最小持続時間チェック
+    keep = (end_ts - start_ts) >= cfg.apnea_min_duration
+    candidates = [
+        {
+            "start": float(start_t),
+            "end": float(end_t),
+            "confidence": 0.5  # 基本信頼度
+        }
+        for start_t, end_t in zip(start_ts[keep], end_ts[keep])
+    ]
 
     return candidates
 
@@ -294,50 +340,82 @@ def detect_snore(rms_t: np.ndarray, snore_energy: np.ndarray, cfg: AudioConfig)
         [{"start": 開始時刻, "end": 終了時刻, "level": 強度}, ...]
     """
     # いびき帯域の高エネルギー区間を検出
-    threshold = np.percentile(snore_energy, 75)
+    threshold = _pct(snore_energy, 75)
 
     is_snore = (snore_energy > threshold)
 
     # 連続区間を検出
-    snore_events = []
-    in_snore = False
-    start_idx = 0
-
-    for i in range(len(is_snore)):
-        if is_snore[i] and not in_snore:
-            in_snore = True
-            start_idx = i
-        elif not is_snore[i] and in_snore:
-            in_snore = False
-            start_t = rms_t[start_idx]
-            end_t = rms_t[i]
-
-            # 0.5秒以上のいびきのみ記録
-            if (end_t - start_t) >= 0.5:
-                level = float(np.mean(snore_energy[start_idx:i]) / (np.max(snore_energy) + 1e-10))
-                snore_events.append({
-                    "start": float(start_t),
-                    "end": float(end_t),
-                    "level": level
-                })
-
-    if in_snore:
-        start_t = rms_t[start_idx]
-        end_t = rms_t[-1]
-        if (end_t - start_t) >= 0.5:
-            level = float(np.mean(snore_energy[start_idx:]) / (np.max(snore_energy) + 1e-10))
-            snore_events.append({
-                "start": float(start_t),
-                "end": float(end_t),
-                "level": level
-            })
+    starts, ends = _find_runs(is_snore)
+    start_ts = rms_t[starts]
+    end_ts = rms_t[np.minimum(ends, len(rms_t) - 1)]
+
+    # 0.5秒以上のいびきのみ記録
+    keep = (end_ts - start_ts) >= 0.5
+    max_energy = np.max(snore_energy) + 1e-10 if len(snore_energy) > 0 else 1.0
+    snore_events = [
+        {
+            "start": float(start_t),
+            "end": float(end_t),
+            "level": float(np.mean(snore_energy[start_idx:end_idx]) / max_energy)
+        }
+        for start_idx, end_idx, start_t, end_t in zip(
+            starts[keep], ends[keep], start_ts[keep], end_ts[keep]
+        )
+    ]
 
     return snore_events
 
 
+def _lttb_indices(times: np.ndarray, values: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    LTTB (Largest-Triangle-Three-Buckets) で残すインデックスを選択
+
+    各バケットから、前に選んだ点と次バケットの平均点とで作る三角形の面積が
+    最大となる点を選ぶため、ピークや谷が間引きで消えにくい。
+
+    Args:
+        times: 時刻配列
+        values: 値配列
+        n_out: 出力ポイント数（3以上）
+
+    Returns:
+        インデックス配列
+    """
+    n = len(times)
+    t = times.astype(np.float64, copy=False)
+    y = values.astype(np.float64, copy=False)
+
+    # 先頭・末尾を除いた点を n_out - 2 個のバケットに分割
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+
+    # 各バケットの平均点（次バケットの代表点として使用）
+    counts = np.diff(edges)
+    mean_t = np.add.reduceat(t[1:n - 1], edges[:-1] - 1) / counts
+    mean_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1) / counts
+    mean_t = np.append(mean_t, t[-1])
+    mean_y = np.append(mean_y, y[-1])
+
+    indices = np.empty(n_out, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+
+    prev = 0
+    for k in range(n_out - 2):
+        lo, hi = edges[k], edges[k + 1]
+        # 三角形の面積（定数倍は比較に影響しないため省略）
+        area = np.abs(
+            (t[prev] - mean_t[k + 1]) * (y[lo:hi] - y[prev])
+            - (t[prev] - t[lo:hi]) * (mean_y[k + 1] - y[prev])
+        )
+        prev = lo + int(np.argmax(area))
+        indices[k + 1] = prev
+
+    return indices
+
+
 def downsample_for_plot(times: np.ndarray, values: np.ndarray, max_points: int = 5000) -> Tuple[np.ndarray, np.ndarray]:
     """
-    プロット用にデータをダウンサンプリング
+    プロット用にデータをダウンサンプリング（LTTBでピーク・谷を保持）
 
     Args:
         times: 時刻配列
@@ -350,6 +428,9 @@ def downsample_for_plot(times: np.ndarray, values: np.ndarray, max_points: int =
     if len(times) <= max_points:
         return times, values
 
-    # 等間隔でサンプリング
-    indices = np.linspace(0, len(times) - 1, max_points, dtype=int)
+    if max_points < 3:
+        # LTTBは先頭・末尾＋1バケット以上が必要なので等間隔でサンプリング
+        indices = np.linspace(0, len(times) - 1, max_points, dtype=int)
+    else:
+        indices = _lttb_indices(times, values, max_points)
     return times[indices], values[indices]
@@ -6,7 +6,7 @@ import numpy as np
 import librosa
 import soundfile as sf
 from scipy import signal
-from typing import Tuple, List, Dict
+from typing import Tuple, List, Dict, Optional
 import tempfile
 import subprocess
 
@@ -61,15 +61,15 @@ def load_and_preprocess(video_path: str, target_sr: int = 8000) -> Tuple[np.ndar
     audio, sr = librosa.load(tmp_path, sr=target_sr, mono=True)
 
     # ハイパスフィルタ (低周波ノイズ除去)
-    nyquist = sr / 2
-    cutoff = 100 / nyquist
-    b, a = signal.butter(4, cutoff, btype='high')
-    audio = signal.filtfilt(b, a, audio)
+    # 二次セクション(SOS)形式で設計（伝達関数形式より数値的に安定）
+    # 係数もfloat32にして、librosa.loadのfloat32のまま処理する（float64への昇格を防ぐ）
+    sos = signal.butter(4, 100, btype='high', fs=sr, output='sos').astype(np.float32)
+    audio = signal.sosfiltfilt(sos, audio)
 
-    # 振幅正規化
-    max_val = np.max(np.abs(audio))
+    # 振幅正規化（フィルタ出力をその場で割って追加の配列確保を避ける）
+    max_val = max(audio.max(), -audio.min())
     if max_val > 0:
-        audio = audio / max_val
+        audio /= max_val
 
     return audio, sr
 
@@ -89,45 +89,55 @@ def compute_rms_energy(audio: np.ndarray, sr: int, cfg: SimpleAudioConfig) -> Tu
     win_length = int(cfg.rms_win * sr)
     hop_length = int(cfg.rms_hop * sr)
 
-    # RMS計算
-    rms = librosa.feature.rms(
-        y=audio,
-        frame_length=win_length,
-        hop_length=hop_length
-    )[0]
+    # RMS計算（librosa.feature.rms と同じ中央揃え・ゼロパディング）
+    # フレームはストライドビューで参照し、フレーム配列のコピーを作らずに二乗和を計算
+    audio = np.ascontiguousarray(audio, dtype=np.float32)
+    pad = win_length // 2
+    padded = np.pad(audio, pad, mode='constant')
+    frames = np.lib.stride_tricks.sliding_window_view(padded, win_length)[::hop_length]
+    power = np.einsum('ij,ij->i', frames, frames) / np.float32(win_length)
+    rms = np.sqrt(power)
 
-    # 時刻配列
-    times = librosa.frames_to_time(
-        np.arange(len(rms)),
-        sr=sr,
-        hop_length=hop_length
-    )
+    # 時刻配列（フレーム番号 × ホップ長 / サンプリングレート）
+    times = np.arange(len(rms)) * hop_length / sr
 
     return times, rms
 
 
-def analyze_audio_statistics(rms: np.ndarray) -> Dict:
+# analyze_audio_statisticsが使用するパーセンタイル
+STATS_PERCENTILES = (0, 10, 25, 30, 50, 75, 90, 100)
+
+
+def analyze_audio_statistics(rms: np.ndarray, percentile_values: Optional[Dict[float, float]] = None) -> Dict:
     """
     音声統計を分析してパラメータ推定
 
     Args:
         rms: RMS配列
+        percentile_values: 算出済みのパーセンタイル値 {パーセンタイル: 値}。
+            STATS_PERCENTILESを含むこと。呼び出し側で他の閾値と一緒に
+            1回の選択で算出した場合に渡す（Noneの場合はここで算出）
 
     Returns:
         統計情報辞書
     """
+    if percentile_values is None:
+        # 全パーセンタイル（min/max/中央値を含む）を1回の選択でまとめて算出
+        percentile_values = dict(zip(STATS_PERCENTILES, np.percentile(rms, STATS_PERCENTILES)))
+    p0, p10, p25, p30, p50, p75, p90, p100 = (percentile_values[p] for p in STATS_PERCENTILES)
+
     stats = {
-        "min": float(np.min(rms)),
-        "max": float(np.max(rms)),
-        "mean": float(np.mean(rms)),
-        "median": float(np.median(rms)),
-        "std": float(np.std(rms)),
-        "p10": float(np.percentile(rms, 10)),
-        "p25": float(np.percentile(rms, 25)),
-        "p30": float(np.percentile(rms, 30)),
-        "p50": float(np.percentile(rms, 50)),
-        "p75": float(np.percentile(rms, 75)),
-        "p90": float(np.percentile(rms, 90)),
+        "min": float(p0),
+        "max": float(p100),
+        "mean": float(np.mean(rms, dtype=np.float64)),
+        "median": float(p50),
+        "std": float(np.std(rms, dtype=np.float64)),
+        "p10": float(p10),
+        "p25": float(p25),
+        "p30": float(p30),
+        "p50": float(p50),
+        "p75": float(p75),
+        "p90": float(p90),
     }
     return stats
 
@@ -135,7 +145,8 @@ def analyze_audio_statistics(rms: np.ndarray) -> Dict:
 def detect_apnea_simple(
     times: np.ndarray,
     rms: np.ndarray,
-    cfg: SimpleAudioConfig
+    cfg: SimpleAudioConfig,
+    silence_threshold: Optional[float] = None
 ) -> List[Dict]:
     """
     シンプルな無呼吸検出
@@ -146,12 +157,16 @@ def detect_apnea_simple(
         times: 時刻配列
         rms: RMS配列
         cfg: 設定
+        silence_threshold: 算出済みの無音閾値。パラメータを変えて繰り返し検出する場合に
+            np.percentile(rms, [...])で全閾値をまとめて求めて渡す
+            （Noneの場合はcfg.silence_threshold_percentileから算出）
 
     Returns:
         無呼吸イベントリスト
     """
     # 無音閾値を決定（パーセンタイル基準）
-    silence_threshold = np.percentile(rms, cfg.silence_threshold_percentile)
+    if silence_threshold is None:
+        silence_threshold = np.percentile(rms, cfg.silence_threshold_percentile)
 
     # 呼吸再開閾値（無音閾値の数倍）
     resume_threshold = silence_threshold * cfg.resume_threshold_multiplier
@@ -162,46 +177,52 @@ def detect_apnea_simple(
     # 無音区間を検出
     is_silence = rms < silence_threshold
 
-    # 連続する無音区間を検出
-    apnea_events = []
-    in_silence = False
-    silence_start_idx = 0
-
-    for i in range(len(is_silence)):
-        if is_silence[i] and not in_silence:
-            # 無音開始
-            in_silence = True
-            silence_start_idx = i
-
-        elif not is_silence[i] and in_silence:
-            # 無音終了
-            in_silence = False
-            silence_start_time = times[silence_start_idx]
-            silence_end_time = times[i]
-            silence_duration = silence_end_time - silence_start_time
-
-            # 最小持続時間チェック
-            if silence_duration >= cfg.silence_min_duration:
-                # 呼吸再開の大きな音をチェック（無音終了後の数フレーム）
-                check_frames = min(10, len(rms) - i)
-                if check_frames > 0:
-                    resume_peak = np.max(rms[i:i+check_frames])
-
-                    # 呼吸再開の音が十分大きいかチェック
-                    if resume_peak > resume_threshold:
-                        confidence = min(1.0, resume_peak / resume_threshold)
-
-                        apnea_events.append({
-                            "start": float(silence_start_time),
-                            "end": float(silence_end_time),
-                            "duration": float(silence_duration),
-                            "resume_peak": float(resume_peak),
-                            "confidence": float(confidence)
-                        })
+    # 連続する無音区間を検出（立ち上がり/立ち下がりエッジを一括検出）
+    edges = np.diff(is_silence.view(np.int8), prepend=0, append=0)
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+
+    # 最後まで無音の区間は呼吸再開の判定ができないため分けて扱う
+    n = len(rms)
+    open_run = len(ends) > 0 and ends[-1] == n
+    if open_run:
+        last_start = starts[-1]
+        starts = starts[:-1]
+        ends = ends[:-1]
+
+    # 最小持続時間チェック
+    durations = times[ends] - times[starts]
+    valid = durations >= cfg.silence_min_duration
+    starts, ends, durations = starts[valid], ends[valid], durations[valid]
+
+    # 呼吸再開の大きな音をチェック（無音終了後の最大10フレームの最大値）
+    if len(ends) > 0:
+        rms_ext = np.append(rms, -np.inf)  # 終端の区間境界用の番兵
+        bounds = np.column_stack([ends, np.minimum(ends + 10, n)]).ravel()
+        resume_peaks = np.maximum.reduceat(rms_ext, bounds)[::2]
+    else:
+        resume_peaks = rms[:0]
+
+    # 呼吸再開の音が十分大きいかチェック
+    resumed = resume_peaks > resume_threshold
+    confidences = np.minimum(1.0, resume_peaks[resumed] / resume_threshold)
+
+    apnea_events = [
+        {
+            "start": float(times[start]),
+            "end": float(times[end]),
+            "duration": float(duration),
+            "resume_peak": float(resume_peak),
+            "confidence": float(confidence)
+        }
+        for start, end, duration, resume_peak, confidence in zip(
+            starts[resumed], ends[resumed], durations[resumed], resume_peaks[resumed], confidences
+        )
+    ]
 
     # 最後まで無音の場合
-    if in_silence:
-        silence_start_time = times[silence_start_idx]
+    if open_run:
+        silence_start_time = times[last_start]
         silence_end_time = times[-1]
         silence_duration = silence_end_time - silence_start_time
 
@@ -229,17 +250,25 @@ def downsample_for_plot(times: np.ndarray, values: np.ndarray, max_points: int =
     Returns:
         (ダウンサンプリング後時刻配列, ダウンサンプリング後値配列)
     """
-    if len(times) <= max_points:
+    n = len(times)
+    if n <= max_points:
         return times, values
 
+    # 等間隔の整数ステップで足りる場合はスライス（インデックス配列・gatherなし）
+    step = -(-n // max_points)
+    if -(-n // step) >= 0.95 * max_points:
+        return times[::step], values[::step]
+
     # 等間隔でサンプリング
-    indices = np.linspace(0, len(times) - 1, max_points, dtype=int)
+    indices = np.linspace(0, n - 1, max_points, dtype=int)
     return times[indices], values[indices]
 
 
 def get_audio_duration(audio_path: str) -> float:
     """
-    音声ファイルの継続時間を取得（FFprobe使用、軽量・高速）
+    音声ファイルの継続時間を取得（ヘッダのみ読み込み、軽量・高速）
+
+    libsndfileで読めない形式（m4a等）はFFprobeにフォールバックする。
 
     Args:
         audio_path: 音声ファイルパス
@@ -250,6 +279,14 @@ def get_audio_duration(audio_path: str) -> float:
     import subprocess
     import json
 
+    # soundfileでヘッダからフレーム数を取得（プロセス起動なし）
+    try:
+        info = sf.info(audio_path)
+        if info.samplerate > 0:
+            return float(info.frames / info.samplerate)
+    except Exception:
+        pass
+
     # FFprobeでメタデータ取得（ファイル全体を読み込まない）
     cmd = [
         'ffprobe', '-v', 'quiet', '-print_format', 'json',
@@ -28,49 +28,50 @@ def refine_with_motion(
         # 動き量データがない場合は音声候補をそのまま返す
         return apnea_candidates
 
+    if len(apnea_candidates) == 0:
+        return []
+
     # 動き量閾値を計算
     motion_threshold = np.percentile(motion, motion_threshold_percentile)
 
-    refined_events = []
-
-    for candidate in apnea_candidates:
-        start = candidate["start"]
-        end = candidate["end"]
+    starts = np.array([c["start"] for c in apnea_candidates], dtype=np.float64)
+    ends = np.array([c["end"] for c in apnea_candidates], dtype=np.float64)
+    confidences = np.array([c["confidence"] for c in apnea_candidates], dtype=np.float64)
+
+    # 候補区間 [start, end] に入る動き量のインデックス範囲（motion_tは単調増加）
+    lo = np.searchsorted(motion_t, starts, side="left")
+    hi = np.searchsorted(motion_t, ends, side="right")
+    counts = hi - lo
+
+    # 累積和で全候補の区間平均動き量を一括計算
+    cumsum = np.concatenate(([0.0], np.cumsum(motion, dtype=np.float64)))
+    avg_motion = (cumsum[hi] - cumsum[lo]) / np.maximum(counts, 1)
+
+    # 低動き量の場合は信頼度を上げ、高い場合は下げる (誤検出の可能性)
+    confidence_boost = 0.3
+    confidence_penalty = 0.2
+    is_low_motion = avg_motion < motion_threshold
+    new_confidences = np.where(
+        is_low_motion,
+        np.minimum(1.0, confidences + confidence_boost),
+        np.maximum(0.0, confidences - confidence_penalty)
+    )
+
+    # 動き量データがない区間はそのまま採用、信頼度が低すぎる場合は除外
+    no_motion = counts <= 0
+    keep = no_motion | is_low_motion | (new_confidences >= 0.3)
 
-        # 候補区間内の動き量を取得
-        mask = (motion_t >= start) & (motion_t <= end)
-        motion_in_range = motion[mask]
-
-        if len(motion_in_range) == 0:
-            # 動き量データがない区間はそのまま採用
+    refined_events = []
+    for i in np.flatnonzero(keep):
+        candidate = apnea_candidates[i]
+        if no_motion[i]:
             refined_events.append(candidate)
-            continue
-
-        # 区間内の平均動き量
-        avg_motion = np.mean(motion_in_range)
-
-        # 低動き量の場合、信頼度を上げる
-        if avg_motion < motion_threshold:
-            confidence_boost = 0.3
-            new_confidence = min(1.0, candidate["confidence"] + confidence_boost)
-
+        else:
             refined_events.append({
                 "start": candidate["start"],
                 "end": candidate["end"],
-                "confidence": new_confidence
+                "confidence": float(new_confidences[i])
             })
-        else:
-            # 動き量が高い場合は信頼度を下げる (誤検出の可能性)
-            confidence_penalty = 0.2
-            new_confidence = max(0.0, candidate["confidence"] - confidence_penalty)
-
-            # 信頼度が低すぎる場合は除外
-            if new_confidence >= 0.3:
-                refined_events.append({
-                    "start": candidate["start"],
-                    "end": candidate["end"],
-                    "confidence": new_confidence
-                })
 
     return refined_events
 
@@ -89,26 +90,31 @@ def merge_nearby_events(events: List[Dict], max_gap: float = 2.0) -> List[Dict]:
     if len(events) == 0:
         return []
 
-    # 開始時刻でソート
-    sorted_events = sorted(events, key=lambda x: x["start"])
-
-    merged = []
-    current = sorted_events[0].copy()
-
-    for event in sorted_events[1:]:
-        gap = event["start"] - current["end"]
+    # 開始時刻でソート（安定ソート）
+    starts = np.array([e["start"] for e in events], dtype=np.float64)
+    order = np.argsort(starts, kind="stable")
+    sorted_events = [events[i] for i in order]
+    ends = np.array([e["end"] for e in sorted_events], dtype=np.float64)
 
-        if gap <= max_gap:
-            # 統合
-            current["end"] = event["end"]
-            # 信頼度は平均を取る
-            current["confidence"] = (current["confidence"] + event["confidence"]) / 2
-        else:
-            # 現在のイベントを確定し、次へ
-            merged.append(current)
-            current = event.copy()
+    # 直前のイベントの終了時刻とのギャップがmax_gapを超えたら新しいグループ
+    # （統合中のイベントの終了時刻は常に直前に統合したイベントの終了時刻）
+    gaps = starts[order][1:] - ends[:-1]
+    boundaries = np.flatnonzero(gaps > max_gap) + 1
+    group_starts = np.concatenate(([0], boundaries))
+    group_stops = np.concatenate((boundaries, [len(sorted_events)]))
 
-    # 最後のイベント
-    merged.append(current)
+    merged = []
+    for first, stop in zip(group_starts, group_stops):
+        current = sorted_events[first].copy()
+
+        if stop - first > 1:
+            # 統合: 終了時刻は最後のイベント、信頼度は順に2件ずつ平均を取る
+            current["end"] = sorted_events[stop - 1]["end"]
+            confidence = current["confidence"]
+            for event in sorted_events[first + 1:stop]:
+                confidence = (confidence + event["confidence"]) / 2
+            current["confidence"] = confidence
+
+        merged.append(current)
 
     return merged
@@ -3,6 +3,20 @@
 無呼吸やいびきの統計指標を計算
 """
 from typing import List, Dict
+import numpy as np
+
+
+def _durations(events: List[Dict]) -> np.ndarray:
+    """
+    イベントの持続時間を配列に変換
+
+    Args:
+        events: イベントリスト
+
+    Returns:
+        持続時間配列 (秒)
+    """
+    return np.fromiter((e["end"] - e["start"] for e in events), dtype=np.float64, count=len(events))
 
 
 def summarize(apnea_events: List[Dict], snore_events: List[Dict], duration_sec: float) -> Dict:
@@ -21,10 +35,10 @@ def summarize(apnea_events: List[Dict], snore_events: List[Dict], duration_sec:
     apnea_count = len(apnea_events)
 
     if apnea_count > 0:
-        durations = [e["end"] - e["start"] for e in apnea_events]
-        apnea_avg_duration = sum(durations) / len(durations)
-        apnea_max_duration = max(durations)
-        apnea_total_duration = sum(durations)
+        durations = _durations(apnea_events)
+        apnea_total_duration = float(durations.sum())
+        apnea_avg_duration = apnea_total_duration / apnea_count
+        apnea_max_duration = float(durations.max())
     else:
         apnea_avg_duration = 0.0
         apnea_max_duration = 0.0
@@ -38,8 +52,7 @@ def summarize(apnea_events: List[Dict], snore_events: List[Dict], duration_sec:
     snore_count = len(snore_events)
 
     if snore_count > 0:
-        snore_durations = [e["end"] - e["start"] for e in snore_events]
-        snore_total_duration = sum(snore_durations)
+        snore_total_duration = float(_durations(snore_events).sum())
         snore_index = snore_total_duration / duration_sec if duration_sec > 0 else 0.0
     else:
         snore_total_duration = 0.0
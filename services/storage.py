@@ -4,17 +4,31 @@
 """
 import os
 import sqlite3
+import hashlib
+import threading
 import json
+import orjson
 import uuid
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Tuple, BinaryIO
 from pathlib import Path
 import shutil
+import numpy as np
 
 
 class Storage:
     """ストレージマネージャー"""
 
+    # jobsテーブルにキャッシュする動画メタデータのカラム
+    _METADATA_COLUMNS = (
+        ("fps", "REAL"),
+        ("width", "INTEGER"),
+        ("height", "INTEGER"),
+        ("frame_count", "INTEGER"),
+        ("duration", "REAL"),
+    )
+
     def __init__(self, base_dir: str = "./data"):
         self.base_dir = Path(base_dir)
         self.uploads_dir = self.base_dir / "uploads"
@@ -25,81 +39,148 @@ class Storage:
         self.uploads_dir.mkdir(parents=True, exist_ok=True)
         self.results_dir.mkdir(parents=True, exist_ok=True)
 
+        # 接続はプロセスごとに1本を使い回す（fork後の子プロセスでは開き直す）
+        self._conn: Optional[sqlite3.Connection] = None
+        self._conn_pid: Optional[int] = None
+        self._lock = threading.Lock()
+
         # データベース初期化
         self._init_database()
 
+    def _connection(self) -> sqlite3.Connection:
+        """
+        共有SQLite接続を取得（WALモード）
+
+        ProcessPoolExecutorのワーカーは親の接続を継承するため、
+        PIDが変わっていたら新しい接続を開く。
+
+        Returns:
+            sqlite3接続
+        """
+        pid = os.getpid()
+        if self._conn is None or self._conn_pid != pid:
+            conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            self._conn = conn
+            self._conn_pid = pid
+        return self._conn
+
+    @contextmanager
+    def _cursor(self):
+        """
+        ロックを取得して1トランザクション分のカーソルを返す
+
+        ブロックを抜けるとCOMMIT、例外時はROLLBACKする。
+        """
+        if self._conn_pid != os.getpid():
+            # fork時に他スレッドが保持していたロックを引き継がないよう作り直す
+            self._lock = threading.Lock()
+        with self._lock:
+            cursor = self._connection().cursor()
+            cursor.execute("BEGIN")
+            try:
+                yield cursor
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+            else:
+                cursor.execute("COMMIT")
+            finally:
+                cursor.close()
+
     def _init_database(self):
         """データベースの初期化"""
-        conn = sqlite3.connect(str(self.db_path))
-        cursor = conn.cursor()
-
-        # ジョブテーブル
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS jobs (
-                job_id TEXT PRIMARY KEY,
-                name TEXT,
-                file_path TEXT NOT NULL,
-                file_size INTEGER,
-                created_at TEXT NOT NULL,
-                version TEXT NOT NULL,
-                status TEXT DEFAULT 'pending',
-                recording_start_datetime TEXT,
-                time_display_mode TEXT DEFAULT 'relative'
-            )
-        """)
-
-        # 既存テーブルへのカラム追加（マイグレーション）
-        try:
-            cursor.execute("ALTER TABLE jobs ADD COLUMN recording_start_datetime TEXT")
-        except sqlite3.OperationalError:
-            pass  # カラムが既に存在する場合
-
-        try:
-            cursor.execute("ALTER TABLE jobs ADD COLUMN time_display_mode TEXT DEFAULT 'relative'")
-        except sqlite3.OperationalError:
-            pass  # カラムが既に存在する場合
-
-        # イベントテーブル
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS events (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                job_id TEXT NOT NULL,
-                type TEXT NOT NULL,
-                start REAL NOT NULL,
-                end REAL NOT NULL,
-                confidence REAL,
-                level REAL,
-                FOREIGN KEY (job_id) REFERENCES jobs(job_id)
-            )
-        """)
-
-        # サマリテーブル
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS summary (
-                job_id TEXT PRIMARY KEY,
-                apnea_count INTEGER,
-                avg_dur REAL,
-                max_dur REAL,
-                ahi_est REAL,
-                snore_index REAL,
-                FOREIGN KEY (job_id) REFERENCES jobs(job_id)
-            )
-        """)
-
-        # 候補判定テーブル
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS candidate_judgments (
-                job_id TEXT NOT NULL,
-                candidate_id INTEGER NOT NULL,
-                status TEXT NOT NULL,
-                updated_at TEXT NOT NULL,
-                PRIMARY KEY (job_id, candidate_id),
-                FOREIGN KEY (job_id) REFERENCES jobs(job_id)
-            )
-        """)
-
-        conn.commit()
-        conn.close()
+        with self._cursor() as cursor:
+            # ジョブテーブル
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    name TEXT,
+                    file_path TEXT NOT NULL,
+                    file_size INTEGER,
+                    created_at TEXT NOT NULL,
+                    version TEXT NOT NULL,
+                    status TEXT DEFAULT 'pending',
+                    recording_start_datetime TEXT,
+                    time_display_mode TEXT DEFAULT 'relative',
+                    file_hash TEXT,
+                    fps REAL,
+                    width INTEGER,
+                    height INTEGER,
+                    frame_count INTEGER,
+                    duration REAL
+                )
+            """)
+
+            # 既存テーブルへのカラム追加（マイグレーション）
+            try:
+                cursor.execute("ALTER TABLE jobs ADD COLUMN recording_start_datetime TEXT")
+            except sqlite3.OperationalError:
+                pass  # カラムが既に存在する場合
+
+            try:
+                cursor.execute("ALTER TABLE jobs ADD COLUMN time_display_mode TEXT DEFAULT 'relative'")
+            except sqlite3.OperationalError:
+                pass  # カラムが既に存在する場合
+
+            try:
+                cursor.execute("ALTER TABLE jobs ADD COLUMN file_hash TEXT")
+            except sqlite3.OperationalError:
+                pass  # カラムが既に存在する場合
+
+            # 動画メタデータ（毎回コンテナを開き直さないようにキャッシュ）
+            for column, col_type in self._METADATA_COLUMNS:
+                try:
+                    cursor.execute(f"ALTER TABLE jobs ADD COLUMN {column} {col_type}")
+                except sqlite3.OperationalError:
+                    pass  # カラムが既に存在する場合
+
+            # 重複アップロード検索用インデックス
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_file_hash ON jobs (file_hash)")
+
+            # イベントテーブル
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job_id TEXT NOT NULL,
+                    type TEXT NOT NULL,
+                    start REAL NOT NULL,
+                    end REAL NOT NULL,
+                    confidence REAL,
+                    level REAL,
+                    FOREIGN KEY (job_id) REFERENCES jobs(job_id)
+                )
+            """)
+
+            # ジョブ単位のイベント削除・検索用インデックス
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_events_job ON events (job_id)")
+
+            # サマリテーブル
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS summary (
+                    job_id TEXT PRIMARY KEY,
+                    apnea_count INTEGER,
+                    avg_dur REAL,
+                    max_dur REAL,
+                    ahi_est REAL,
+                    snore_index REAL,
+                    FOREIGN KEY (job_id) REFERENCES jobs(job_id)
+                )
+            """)
+
+            # 候補判定テーブル
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS candidate_judgments (
+                    job_id TEXT NOT NULL,
+                    candidate_id INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    updated_at TEXT NOT NULL,
+                    PRIMARY KEY (job_id, candidate_id),
+                    FOREIGN KEY (job_id) REFERENCES jobs(job_id)
+                )
+            """)
 
     def save_upload(self, file_data: bytes, original_filename: str) -> tuple[str, str]:
         """
@@ -121,7 +202,37 @@ class Storage:
 
         return job_id, str(save_path)
 
-    def create_job(self, job_id: str, file_path: str, version: str = "rule-v0.3.1", name: str = None, file_size: int = None):
+    def save_upload_stream(self, file_obj: BinaryIO, original_filename: str,
+                           chunk_size: int = 1 << 20) -> tuple[str, str, int, str]:
+        """
+        アップロードファイルをチャンク単位でディスクに保存（全体をメモリに載せない）
+
+        書き込みと同じパスで内容のハッシュも計算する。
+
+        Args:
+            file_obj: 読み込み元のファイルオブジェクト
+            original_filename: 元のファイル名
+            chunk_size: 1回に読み込むバイト数
+
+        Returns:
+            (job_id, 保存されたファイルパス, ファイルサイズ, ファイルハッシュ)
+        """
+        job_id = str(uuid.uuid4())
+        ext = Path(original_filename).suffix
+        save_path = self.uploads_dir / f"{job_id}{ext}"
+
+        hasher = hashlib.blake2b(digest_size=16)
+        file_size = 0
+        with open(save_path, "wb") as f:
+            while chunk := file_obj.read(chunk_size):
+                hasher.update(chunk)
+                f.write(chunk)
+                file_size += len(chunk)
+
+        return job_id, str(save_path), file_size, hasher.hexdigest()
+
+    def create_job(self, job_id: str, file_path: str, version: str = "rule-v0.3.1", name: str = None, file_size: int = None,
+                   file_hash: str = None, metadata: Optional[Dict] = None):
         """
         ジョブを作成
 
@@ -131,17 +242,18 @@ class Storage:
             version: 解析バージョン
             name: ジョブ名（任意）
             file_size: ファイルサイズ（バイト）
+            file_hash: ファイル内容のハッシュ（重複アップロード検出用、任意）
+            metadata: 動画メタデータ（get_video_metadataの戻り値、音声ファイルの場合はNone）
         """
-        conn = sqlite3.connect(str(self.db_path))
-        cursor = conn.cursor()
-
-        cursor.execute("""
-            INSERT INTO jobs (job_id, name, file_path, file_size, created_at, version, status)
-            VALUES (?, ?, ?, ?, ?, ?, 'processing')
-        """, (job_id, name, file_path, file_size, datetime.now().isoformat(), version))
+        metadata = metadata or {}
 
-        conn.commit()
-        conn.close()
+        with self._cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO jobs (job_id, name, file_path, file_size, created_at, version, status, file_hash,
+                                  fps, width, height, frame_count, duration)
+                VALUES (?, ?, ?, ?, ?, ?, 'processing', ?, ?, ?, ?, ?, ?)
+            """, (job_id, name, file_path, file_size, datetime.now().isoformat(), version, file_hash,
+                  *(metadata.get(column) for column, _ in self._METADATA_COLUMNS)))
 
     def save_results(self, job_id: str, results: Dict):
         """
@@ -151,49 +263,74 @@ class Storage:
             job_id: ジョブID
             results: 解析結果辞書
         """
-        conn = sqlite3.connect(str(self.db_path))
-        cursor = conn.cursor()
-
-        # イベント保存
-        for event in results.get("events", []):
-            cursor.execute("""
-                INSERT INTO events (job_id, type, start, end, confidence, level)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (
-                job_id,
-                event["type"],
-                event["start"],
-                event["end"],
-                event.get("confidence"),
-                event.get("level")
+        # JSON結果ファイルを一時ファイルに書き込む（DBロックの外で書き込む）
+        result_path = self.results_dir / f"{job_id}.json"
+        tmp_path = result_path.with_suffix(".tmp")
+        # numpy配列はorjsonで直接シリアライズ（Pythonのfloatリストを経由しない）
+        with open(tmp_path, "wb") as f:
+            f.write(orjson.dumps(
+                results,
+                option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
             ))
 
-        # サマリ保存
+        event_rows = [
+            (job_id, event["type"], event["start"], event["end"], event.get("confidence"), event.get("level"))
+            for event in results.get("events", [])
+        ]
         summary = results.get("summary", {})
-        cursor.execute("""
-            INSERT OR REPLACE INTO summary (job_id, apnea_count, avg_dur, max_dur, ahi_est, snore_index)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (
-            job_id,
-            summary.get("apnea_count", 0),
-            summary.get("apnea_avg_duration", 0.0),
-            summary.get("apnea_max_duration", 0.0),
-            summary.get("ahi_est", 0.0),
-            summary.get("snore_index", 0.0)
-        ))
-
-        # JSON結果ファイル保存
-        result_path = self.results_dir / f"{job_id}.json"
-        with open(result_path, "w", encoding="utf-8") as f:
-            json.dump(results, f, ensure_ascii=False, indent=2)
 
-        # ジョブステータス更新
-        cursor.execute("""
-            UPDATE jobs SET status = 'completed' WHERE job_id = ?
-        """, (job_id,))
+        # イベント・サマリ・ステータスを1トランザクションで保存
+        # 同じジョブの再保存でイベント行が重複しないよう、既存行を削除してから挿入
+        try:
+            with self._cursor() as cursor:
+                cursor.execute("DELETE FROM events WHERE job_id = ?", (job_id,))
+                cursor.executemany("""
+                    INSERT INTO events (job_id, type, start, end, confidence, level)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, event_rows)
+
+                cursor.execute("""
+                    INSERT OR REPLACE INTO summary (job_id, apnea_count, avg_dur, max_dur, ahi_est, snore_index)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, (
+                    job_id,
+                    summary.get("apnea_count", 0),
+                    summary.get("apnea_avg_duration", 0.0),
+                    summary.get("apnea_max_duration", 0.0),
+                    summary.get("ahi_est", 0.0),
+                    summary.get("snore_index", 0.0)
+                ))
+
+                # ジョブステータス更新
+                cursor.execute("""
+                    UPDATE jobs SET status = 'completed' WHERE job_id = ?
+                """, (job_id,))
+        except Exception:
+            tmp_path.unlink(missing_ok=True)
+            raise
+
+        # DBのコミット後に結果ファイルを置き換え（書きかけのJSONを読ませない）
+        os.replace(tmp_path, result_path)
+
+    def update_job_status(self, job_id: str, status: str) -> bool:
+        """
+        ジョブステータスを更新
 
-        conn.commit()
-        conn.close()
+        Args:
+            job_id: ジョブID
+            status: ステータス (processing/running/completed/failed)
+
+        Returns:
+            成功したらTrue
+        """
+        with self._cursor() as cursor:
+            cursor.execute("""
+                UPDATE jobs SET status = ? WHERE job_id = ?
+            """, (status, job_id))
+
+            affected = cursor.rowcount
+
+        return affected > 0
 
     def get_job(self, job_id: str) -> Optional[Dict]:
         """
@@ -205,16 +342,13 @@ class Storage:
         Returns:
             ジョブ情報辞書、存在しない場合はNone
         """
-        conn = sqlite3.connect(str(self.db_path))
-        cursor = conn.cursor()
-
-        cursor.execute("""
-            SELECT job_id, file_path, created_at, version, status, recording_start_datetime, time_display_mode
-            FROM jobs WHERE job_id = ?
-        """, (job_id,))
+        with self._cursor() as cursor:
+            cursor.execute("""
+                SELECT job_id, file_path, created_at, version, status, recording_start_datetime, time_display_mode
+                FROM jobs WHERE job_id = ?
+            """, (job_id,))
 
-        row = cursor.fetchone()
-        conn.close()
+            row = cursor.fetchone()
 
         if row:
             return {
@@ -228,6 +362,31 @@ class Storage:
             }
         return None
 
+    def find_by_hash(self, file_hash: str, version: str) -> Optional[str]:
+        """
+        同じ内容・同じ解析バージョンで完了済みのジョブを検索
+
+        Args:
+            file_hash: ファイル内容のハッシュ
+            version: 解析バージョン
+
+        Returns:
+            ジョブID、存在しない場合はNone
+        """
+        with self._cursor() as cursor:
+            cursor.execute("""
+                SELECT job_id FROM jobs
+                WHERE file_hash = ? AND version = ? AND status = 'completed'
+                ORDER BY created_at DESC
+                LIMIT 1
+            """, (file_hash, version))
+
+            row = cursor.fetchone()
+
+        if row:
+            return row[0]
+        return None
+
     def load_results(self, job_id: str) -> Optional[Dict]:
         """
         解析結果をロード
@@ -241,8 +400,82 @@ class Storage:
         result_path = self.results_dir / f"{job_id}.json"
 
         if result_path.exists():
-            with open(result_path, "r", encoding="utf-8") as f:
-                return json.load(f)
+            with open(result_path, "rb") as f:
+                data = f.read()
+            try:
+                return orjson.loads(data)
+            except orjson.JSONDecodeError:
+                # 旧バージョンが標準jsonで書いたNaN/Infinityを含むファイル
+                return json.loads(data)
+        return None
+
+    def save_rms(self, job_id: str, times: np.ndarray, rms: np.ndarray):
+        """
+        RMS時系列をバイナリ (.npy) で保存
+
+        RMSはfloat32のまま、時刻はfloat64で別ファイルに保存する
+        （1つの配列にまとめるとRMSがfloat64に変換されサイズが倍になる）。
+        一時ファイルに書いてから置き換え、時刻→RMSの順に確定させる
+        （RMSファイルがあれば対応する時刻ファイルも必ず存在する）。
+
+        Args:
+            job_id: ジョブID
+            times: 時刻配列
+            rms: RMS配列
+        """
+        for path, data in (
+            (self.results_dir / f"{job_id}_rms_t.npy", np.asarray(times, dtype=np.float64)),
+            (self.results_dir / f"{job_id}_rms.npy", np.asarray(rms, dtype=np.float32)),
+        ):
+            tmp_path = path.with_suffix(".tmp")
+            with open(tmp_path, "wb") as f:
+                np.save(f, data)
+            os.replace(tmp_path, path)
+
+    def load_rms(self, job_id: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        RMS時系列をロード (メモリマップ、JSONのパースなし)
+
+        Args:
+            job_id: ジョブID
+
+        Returns:
+            (時刻配列, RMS配列)、存在しない場合はNone
+        """
+        rms_path = self.results_dir / f"{job_id}_rms.npy"
+        times_path = self.results_dir / f"{job_id}_rms_t.npy"
+
+        if rms_path.exists() and times_path.exists():
+            return np.load(times_path, mmap_mode="r"), np.load(rms_path, mmap_mode="r")
+        return None
+
+    def save_peaks(self, job_id: str, peaks: np.ndarray, top_peaks: np.ndarray):
+        """
+        候補抽出のピーク位置をバイナリ (.npz) で保存（結果JSONは書き換えない）
+
+        Args:
+            job_id: ジョブID
+            peaks: 全ピークのRMSフレーム位置
+            top_peaks: 候補として抽出した上位ピークの位置（候補ID順）
+        """
+        peaks_path = self.results_dir / f"{job_id}_peaks.npz"
+        np.savez(peaks_path, peaks=np.asarray(peaks, dtype=np.int64), top_peaks=np.asarray(top_peaks, dtype=np.int64))
+
+    def load_peaks(self, job_id: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        候補抽出のピーク位置をロード
+
+        Args:
+            job_id: ジョブID
+
+        Returns:
+            (全ピーク位置, 上位ピーク位置)、存在しない場合はNone
+        """
+        peaks_path = self.results_dir / f"{job_id}_peaks.npz"
+
+        if peaks_path.exists():
+            with np.load(peaks_path) as data:
+                return data["peaks"], data["top_peaks"]
         return None
 
     def get_video_path(self, job_id: str) -> Optional[str]:
@@ -270,18 +503,15 @@ class Storage:
         Returns:
             ジョブ情報のリスト
         """
-        conn = sqlite3.connect(str(self.db_path))
-        cursor = conn.cursor()
-
-        cursor.execute("""
-            SELECT job_id, name, file_path, file_size, created_at, version, status
-            FROM jobs
-            ORDER BY created_at DESC
-            LIMIT ?
-        """, (limit,))
+        with self._cursor() as cursor:
+            cursor.execute("""
+                SELECT job_id, name, file_path, file_size, created_at, version, status
+                FROM jobs
+                ORDER BY created_at DESC
+                LIMIT ?
+            """, (limit,))
 
-        rows = cursor.fetchall()
-        conn.close()
+            rows = cursor.fetchall()
 
         return [
             {
@@ -307,16 +537,12 @@ class Storage:
         Returns:
             成功したらTrue
         """
-        conn = sqlite3.connect(str(self.db_path))
-        cursor = conn.cursor()
-
-        cursor.execute("""
-            UPDATE jobs SET name = ? WHERE job_id = ?
-        """, (name, job_id))
+        with self._cursor() as cursor:
+            cursor.execute("""
+                UPDATE jobs SET name = ? WHERE job_id = ?
+            """, (name, job_id))
 
-        affected = cursor.rowcount
-        conn.commit()
-        conn.close()
+            affected = cursor.rowcount
 
         return affected > 0
 
@@ -335,39 +561,39 @@ class Storage:
         if not job:
             return False
 
-        conn = sqlite3.connect(str(self.db_path))
-        cursor = conn.cursor()
-
-        try:
-            # データベースから削除
+        # データベースから削除（失敗時はロールバック）
+        with self._cursor() as cursor:
             cursor.execute("DELETE FROM events WHERE job_id = ?", (job_id,))
             cursor.execute("DELETE FROM summary WHERE job_id = ?", (job_id,))
             cursor.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
-            conn.commit()
 
-            # ファイル削除
-            # 動画ファイル
-            video_path = Path(job["file_path"])
-            if video_path.exists():
-                video_path.unlink()
+        # ファイル削除
+        # 動画ファイル
+        video_path = Path(job["file_path"])
+        if video_path.exists():
+            video_path.unlink()
 
-            # 音声ファイル
-            audio_path = self.uploads_dir / f"{job_id}_audio.wav"
-            if audio_path.exists():
-                audio_path.unlink()
+        # 音声ファイル
+        audio_path = self.uploads_dir / f"{job_id}_audio.wav"
+        if audio_path.exists():
+            audio_path.unlink()
 
-            # 結果JSONファイル
-            result_path = self.results_dir / f"{job_id}.json"
-            if result_path.exists():
-                result_path.unlink()
+        # 結果JSONファイル
+        result_path = self.results_dir / f"{job_id}.json"
+        if result_path.exists():
+            result_path.unlink()
 
-            return True
+        # RMSバイナリファイル
+        for rms_path in (self.results_dir / f"{job_id}_rms.npy", self.results_dir / f"{job_id}_rms_t.npy"):
+            if rms_path.exists():
+                rms_path.unlink()
 
-        except Exception as e:
-            conn.rollback()
-            raise e
-        finally:
-            conn.close()
+        # 候補ピーク位置ファイル
+        peaks_path = self.results_dir / f"{job_id}_peaks.npz"
+        if peaks_path.exists():
+            peaks_path.unlink()
+
+        return True
 
     def save_candidate_judgment(self, job_id: str, candidate_id: int, status: str):
         """
@@ -378,16 +604,11 @@ class Storage:
             candidate_id: 候補ID
             status: 判定結果 (pending/apnea/skip)
         """
-        conn = sqlite3.connect(str(self.db_path))
-        cursor = conn.cursor()
-
-        cursor.execute("""
-            INSERT OR REPLACE INTO candidate_judgments (job_id, candidate_id, status, updated_at)
-            VALUES (?, ?, ?, ?)
-        """, (job_id, candidate_id, status, datetime.now().isoformat()))
-
-        conn.commit()
-        conn.close()
+        with self._cursor() as cursor:
+            cursor.execute("""
+                INSERT OR REPLACE INTO candidate_judgments (job_id, candidate_id, status, updated_at)
+                VALUES (?, ?, ?, ?)
+            """, (job_id, candidate_id, status, datetime.now().isoformat()))
 
     def get_candidate_judgments(self, job_id: str) -> Dict[int, str]:
         """
@@ -399,17 +620,14 @@ class Storage:
         Returns:
             候補IDをキーとした判定結果の辞書
         """
-        conn = sqlite3.connect(str(self.db_path))
-        cursor = conn.cursor()
-
-        cursor.execute("""
-            SELECT candidate_id, status
-            FROM candidate_judgments
-            WHERE job_id = ?
-        """, (job_id,))
+        with self._cursor() as cursor:
+            cursor.execute("""
+                SELECT candidate_id, status
+                FROM candidate_judgments
+                WHERE job_id = ?
+            """, (job_id,))
 
-        rows = cursor.fetchall()
-        conn.close()
+            rows = cursor.fetchall()
 
         return {row[0]: row[1] for row in rows}
 
@@ -424,16 +642,12 @@ class Storage:
         Returns:
             成功したらTrue
         """
-        conn = sqlite3.connect(str(self.db_path))
-        cursor = conn.cursor()
-
-        cursor.execute("""
-            UPDATE jobs SET recording_start_datetime = ? WHERE job_id = ?
-        """, (recording_start_datetime, job_id))
+        with self._cursor() as cursor:
+            cursor.execute("""
+                UPDATE jobs SET recording_start_datetime = ? WHERE job_id = ?
+            """, (recording_start_datetime, job_id))
 
-        affected = cursor.rowcount
-        conn.commit()
-        conn.close()
+            affected = cursor.rowcount
 
         return affected > 0
 
@@ -451,15 +665,11 @@ class Storage:
         if mode not in ['relative', 'absolute']:
             return False
 
-        conn = sqlite3.connect(str(self.db_path))
-        cursor = conn.cursor()
-
-        cursor.execute("""
-            UPDATE jobs SET time_display_mode = ? WHERE job_id = ?
-        """, (mode, job_id))
+        with self._cursor() as cursor:
+            cursor.execute("""
+                UPDATE jobs SET time_display_mode = ? WHERE job_id = ?
+            """, (mode, job_id))
 
-        affected = cursor.rowcount
-        conn.commit()
-        conn.close()
+            affected = cursor.rowcount
 
         return affected > 0
@@ -5,8 +5,35 @@
 import cv2
 import numpy as np
 from typing import Tuple, Optional
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import os
 import subprocess
 import json
+import threading
+
+
+# フレーム抽出用に開いたままにしておく動画の最大数
+READER_CACHE_SIZE = 4
+
+
+class _CachedReader:
+    """キャッシュ中のVideoCapture。VideoCaptureはスレッドセーフでないためロックで保護"""
+    def __init__(self, cap: cv2.VideoCapture):
+        self.cap = cap
+        self.lock = threading.Lock()
+        self.closed = False  # キャッシュから外されて解放済みか（lock保持中に参照）
+
+    def close(self):
+        """読み込み中のスレッドを待ってから解放"""
+        with self.lock:
+            self.cap.release()
+            self.closed = True
+
+
+# 動画パス → キャッシュ中のVideoCapture
+_readers: "OrderedDict[str, _CachedReader]" = OrderedDict()
+_readers_lock = threading.Lock()
 
 
 def get_video_metadata(video_path: str) -> dict:
@@ -42,6 +69,71 @@ def get_video_metadata(video_path: str) -> dict:
     }
 
 
+def _get_reader(video_path: str) -> Optional[_CachedReader]:
+    """
+    キャッシュ済みのVideoCaptureを取得（なければ開いてキャッシュ）
+
+    候補確認などで同じ動画から何度もフレームを取る場合に、
+    毎回の動画オープンとデコーダ初期化を省く。
+    キャッシュから溢れた古いものは閉じるため、呼び出し側はlockを取った後に
+    closedを確認すること。
+
+    Args:
+        video_path: 動画ファイルパス
+
+    Returns:
+        キャッシュ中のVideoCapture、開けない場合はNone
+    """
+    with _readers_lock:
+        reader = _readers.get(video_path)
+        if reader is not None:
+            _readers.move_to_end(video_path)
+            return reader
+
+    # 動画のオープンは遅いため、キャッシュのロック外で行う（他の動画の取得を待たせない）
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        cap.release()
+        return None
+
+    evicted = []
+    with _readers_lock:
+        reader = _readers.get(video_path)
+        if reader is not None:
+            # 開いている間に別スレッドが同じ動画をキャッシュした場合はそちらを使う
+            _readers.move_to_end(video_path)
+        else:
+            reader = _CachedReader(cap)
+            _readers[video_path] = reader
+            cap = None
+
+            # 古いものからキャッシュを外す
+            while len(_readers) > READER_CACHE_SIZE:
+                evicted.append(_readers.popitem(last=False)[1])
+
+    if cap is not None:
+        cap.release()
+
+    # 読み込み中のスレッドを待つため、解放はキャッシュのロック外で行う
+    for old_reader in evicted:
+        old_reader.close()
+
+    return reader
+
+
+def release_reader(video_path: str):
+    """
+    キャッシュ済みのVideoCaptureを閉じる（動画削除時など）
+
+    Args:
+        video_path: 動画ファイルパス
+    """
+    with _readers_lock:
+        reader = _readers.pop(video_path, None)
+    if reader is not None:
+        reader.close()
+
+
 def extract_frame_at_time(video_path: str, time_sec: float) -> Optional[np.ndarray]:
     """
     指定時刻のフレームを抽出
@@ -53,16 +145,21 @@ def extract_frame_at_time(video_path: str, time_sec: float) -> Optional[np.ndarr
     Returns:
         フレーム画像 (BGR形式のnumpy配列)、失敗時はNone
     """
-    cap = cv2.VideoCapture(video_path)
+    while True:
+        reader = _get_reader(video_path)
 
-    if not cap.isOpened():
-        return None
+        if reader is None:
+            return None
 
-    # 指定時刻にシーク
-    cap.set(cv2.CAP_PROP_POS_MSEC, time_sec * 1000)
+        with reader.lock:
+            # 取得後に他のスレッドがキャッシュから外して閉じた場合は開き直す
+            if reader.closed:
+                continue
 
-    ret, frame = cap.read()
-    cap.release()
+            # 指定時刻にシーク
+            reader.cap.set(cv2.CAP_PROP_POS_MSEC, time_sec * 1000)
+            ret, frame = reader.cap.read()
+            break
 
     if ret:
         return frame
@@ -98,13 +195,67 @@ def extract_frame_by_index(video_path: str, frame_index: int) -> Optional[np.nda
         return None
 
 
-def motion_series(video_path: str, fps: float = 1.0) -> Tuple[np.ndarray, np.ndarray]:
+def _flow_magnitude(prev_gray: np.ndarray, gray: np.ndarray) -> float:
+    """
+    2フレーム間のオプティカルフロー (Farneback法) の平均移動量
+
+    Args:
+        prev_gray: 前フレーム (グレースケール)
+        gray: 現フレーム (グレースケール)
+
+    Returns:
+        動き量
+    """
+    flow = cv2.calcOpticalFlowFarneback(
+        prev_gray, gray,
+        None,
+        pyr_scale=0.5,
+        levels=3,
+        winsize=15,
+        iterations=3,
+        poly_n=5,
+        poly_sigma=1.2,
+        flags=0
+    )
+
+    # フロー magnitude (動き量)
+    mag, ang = cv2.cartToPolar(flow[..., 0], flow[..., 1])
+    return float(np.mean(mag))
+
+
+def _diff_magnitude(prev_gray: np.ndarray, gray: np.ndarray) -> float:
+    """
+    2フレーム間の平均絶対差分（動き量の簡易指標）
+
+    Args:
+        prev_gray: 前フレーム (グレースケール)
+        gray: 現フレーム (グレースケール)
+
+    Returns:
+        動き量
+    """
+    return float(cv2.absdiff(prev_gray, gray).mean())
+
+
+def motion_series(video_path: str, fps: float = 1.0, batch_size: int = 32,
+                  use_dense_flow: bool = False, metadata: Optional[dict] = None) -> Tuple[np.ndarray, np.ndarray]:
     """
     動画から動き量の時系列データを抽出
 
+    既定ではフレーム差分（calculate_chest_motionと同じ方式）を動き量とする。
+    動き量は1フレームあたり1つのスカラーに集約されるため、Farneback法の
+    密なオプティカルフローより桁違いに軽い差分で十分判別できる。
+
+    サンプリング対象外のフレームはgrab()で読み飛ばし（色変換なし）、
+    動き量はbatch_sizeフレームずつスレッドプールで並列計算する
+    （OpenCVの関数はGILを解放する）。
+
     Args:
         video_path: 動画ファイルパス
         fps: サンプリングFPS (デフォルト1.0 = 1秒ごと)
+        batch_size: 並列計算するフレーム数（メモリ使用量の上限）
+        use_dense_flow: Trueの場合はFarneback法のオプティカルフローを使用
+        metadata: キャッシュ済みの動画メタデータ（指定時はFPSを動画から読まない）
 
     Returns:
         (時刻配列, 動き量配列)
@@ -114,57 +265,65 @@ def motion_series(video_path: str, fps: float = 1.0) -> Tuple[np.ndarray, np.nda
     if not cap.isOpened():
         raise ValueError(f"Cannot open video file: {video_path}")
 
-    video_fps = cap.get(cv2.CAP_PROP_FPS)
-    frame_interval = int(video_fps / fps)  # サンプリング間隔
+    video_fps = metadata["fps"] if metadata else cap.get(cv2.CAP_PROP_FPS)
+    frame_interval = max(1, int(video_fps / fps))  # サンプリング間隔
 
     times = []
     motions = []
 
     prev_gray = None
+    batch_times = []
+    batch_grays = []
     frame_idx = 0
 
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
+    measure = _flow_magnitude if use_dense_flow else _diff_magnitude
+
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as pool:
+        def flush():
+            # 直前バッチの最終フレームと連結して隣接ペアごとにフローを計算
+            pairs_prev = [prev_gray] + batch_grays[:-1]
+            motions.extend(pool.map(measure, pairs_prev, batch_grays))
+            times.extend(batch_times)
+
+        while True:
+            # サンプリングFPSに従って処理（対象外はデコードのみ）
+            if frame_idx % frame_interval != 0:
+                if not cap.grab():
+                    break
+                frame_idx += 1
+                continue
+
+            ret, frame = cap.read()
+            if not ret:
+                break
 
-        # サンプリングFPSに従って処理
-        if frame_idx % frame_interval == 0:
             # グレースケール変換
             gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
 
-            if prev_gray is not None:
-                # オプティカルフロー (Farneback法)
-                flow = cv2.calcOpticalFlowFarneback(
-                    prev_gray, gray,
-                    None,
-                    pyr_scale=0.5,
-                    levels=3,
-                    winsize=15,
-                    iterations=3,
-                    poly_n=5,
-                    poly_sigma=1.2,
-                    flags=0
-                )
-
-                # フロー magnitude (動き量)
-                mag, ang = cv2.cartToPolar(flow[..., 0], flow[..., 1])
-                motion_value = np.mean(mag)
+            if prev_gray is None and not batch_grays:
+                prev_gray = gray
+            else:
+                batch_times.append(frame_idx / video_fps)
+                batch_grays.append(gray)
 
-                time_sec = frame_idx / video_fps
-                times.append(time_sec)
-                motions.append(motion_value)
+                if len(batch_grays) >= batch_size:
+                    flush()
+                    prev_gray = batch_grays[-1]
+                    batch_times = []
+                    batch_grays = []
 
-            prev_gray = gray.copy()
+            frame_idx += 1
 
-        frame_idx += 1
+        if batch_grays:
+            flush()
 
     cap.release()
 
     return np.array(times), np.array(motions)
 
 
-def calculate_chest_motion(video_path: str, roi: Optional[Tuple[int, int, int, int]] = None, fps: float = 1.0) -> Tuple[np.ndarray, np.ndarray]:
+def calculate_chest_motion(video_path: str, roi: Optional[Tuple[int, int, int, int]] = None, fps: float = 1.0,
+                           metadata: Optional[dict] = None) -> Tuple[np.ndarray, np.ndarray]:
     """
     胸郭領域の動き量を計算 (ROI指定可能)
 
@@ -172,6 +331,7 @@ def calculate_chest_motion(video_path: str, roi: Optional[Tuple[int, int, int, i
         video_path: 動画ファイルパス
         roi: (x, y, width, height) の形式でROIを指定。Noneの場合は画像中央部を使用
         fps: サンプリングFPS
+        metadata: キャッシュ済みの動画メタデータ（指定時はFPS・サイズを動画から読まない）
 
     Returns:
         (時刻配列, 動き量配列)
@@ -181,13 +341,16 @@ def calculate_chest_motion(video_path: str, roi: Optional[Tuple[int, int, int, i
     if not cap.isOpened():
         raise ValueError(f"Cannot open video file: {video_path}")
 
-    video_fps = cap.get(cv2.CAP_PROP_FPS)
+    video_fps = metadata["fps"] if metadata else cap.get(cv2.CAP_PROP_FPS)
     frame_interval = int(video_fps / fps)
 
     # ROIのデフォルト設定 (画像中央50%領域)
     if roi is None:
-        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        if metadata:
+            width, height = metadata["width"], metadata["height"]
+        else:
+            width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+            height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
         roi = (
             int(width * 0.25),
             int(height * 0.25),
@@ -231,6 +394,92 @@ def calculate_chest_motion(video_path: str, roi: Optional[Tuple[int, int, int, i
     return np.array(times), np.array(motions)
 
 
+def compute_motion_signals(video_path: str, roi: Optional[Tuple[int, int, int, int]] = None, fps: float = 1.0,
+                           use_dense_flow: bool = False, metadata: Optional[dict] = None) -> dict:
+    """
+    全体の動き量と胸郭ROIの動き量を1回のデコードで計算
+
+    motion_seriesとcalculate_chest_motionを両方呼ぶと同じ動画を2回デコードするため、
+    1つのループでグレースケール変換を1回だけ行い、ROIはそのビューから切り出す。
+
+    Args:
+        video_path: 動画ファイルパス
+        roi: (x, y, width, height) の形式でROIを指定。Noneの場合は画像中央部を使用
+        fps: サンプリングFPS
+        use_dense_flow: Trueの場合は全体の動き量にFarneback法のオプティカルフローを使用
+        metadata: キャッシュ済みの動画メタデータ（指定時はFPS・サイズを動画から読まない）
+
+    Returns:
+        {"whole_t": 時刻配列, "whole_motion": 全体の動き量配列,
+         "roi_t": 時刻配列, "roi_motion": ROIの動き量配列}
+    """
+    cap = cv2.VideoCapture(video_path)
+
+    if not cap.isOpened():
+        raise ValueError(f"Cannot open video file: {video_path}")
+
+    video_fps = metadata["fps"] if metadata else cap.get(cv2.CAP_PROP_FPS)
+    frame_interval = max(1, int(video_fps / fps))  # サンプリング間隔
+
+    # ROIのデフォルト設定 (画像中央50%領域)
+    if roi is None:
+        if metadata:
+            width, height = metadata["width"], metadata["height"]
+        else:
+            width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+            height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        roi = (
+            int(width * 0.25),
+            int(height * 0.25),
+            int(width * 0.5),
+            int(height * 0.5)
+        )
+
+    x, y, w, h = roi
+
+    measure = _flow_magnitude if use_dense_flow else _diff_magnitude
+
+    times = []
+    whole_motions = []
+    roi_motions = []
+
+    prev_gray = None
+    frame_idx = 0
+
+    while True:
+        # サンプリングFPSに従って処理（対象外はデコードのみ）
+        if frame_idx % frame_interval != 0:
+            if not cap.grab():
+                break
+            frame_idx += 1
+            continue
+
+        ret, frame = cap.read()
+        if not ret:
+            break
+
+        # グレースケール変換は1回、ROIはコピーせずビューで参照
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+        if prev_gray is not None:
+            times.append(frame_idx / video_fps)
+            whole_motions.append(measure(prev_gray, gray))
+            roi_motions.append(_diff_magnitude(prev_gray[y:y+h, x:x+w], gray[y:y+h, x:x+w]))
+
+        prev_gray = gray
+        frame_idx += 1
+
+    cap.release()
+
+    t = np.array(times)
+    return {
+        "whole_t": t,
+        "whole_motion": np.array(whole_motions),
+        "roi_t": t,
+        "roi_motion": np.array(roi_motions)
+    }
+
+
 def encode_frame_to_jpeg(frame: np.ndarray, quality: int = 85) -> bytes:
     """
     フレームをJPEGバイト列にエンコード
@@ -0,0 +1,107 @@
+"""
+無音区間パターン分析スクリプトのテスト
+ベクトル化した実装が元のループ実装と同じ分析結果を出力することを確認
+"""
+import sys
+from pathlib import Path
+
+import numpy as np
+
+# モジュールパスを追加
+sys.path.append(str(Path(__file__).parent.parent))
+
+import analyze_silence_patterns
+from services import audio_simple
+
+
+def _silence_report_loop(times, rms):
+    """analyze_silence_patterns の元の無音区間ループ（[4/4]以降の出力、比較用）"""
+    lines = []
+    test_percentiles = [20, 25, 30, 35, 40, 45, 50]
+
+    for percentile in test_percentiles:
+        silence_threshold = np.percentile(rms, percentile)
+
+        is_silence = rms < silence_threshold
+
+        silence_segments = []
+        in_silence = False
+        silence_start_idx = 0
+
+        for i in range(len(is_silence)):
+            if is_silence[i] and not in_silence:
+                in_silence = True
+                silence_start_idx = i
+            elif not is_silence[i] and in_silence:
+                in_silence = False
+                duration = times[i] - times[silence_start_idx]
+
+                check_frames = min(20, len(rms) - i)
+                if check_frames > 0:
+                    resume_peak = np.max(rms[i:i+check_frames])
+
+                    silence_segments.append({
+                        'start': times[silence_start_idx],
+                        'end': times[i],
+                        'duration': duration,
+                        'ratio_peak': resume_peak / silence_threshold if silence_threshold > 0 else 0,
+                    })
+
+        if len(silence_segments) > 0:
+            durations = [s['duration'] for s in silence_segments]
+            long_silence = [s for s in silence_segments if s['duration'] >= 10.0]
+
+            lines.append(f'--- 無音閾値 {percentile}%tile (RMS={silence_threshold:.6f}) ---')
+            lines.append(f'  全無音区間数: {len(silence_segments)}')
+            lines.append(f'  無音持続時間: min={min(durations):.1f}s, max={max(durations):.1f}s, mean={np.mean(durations):.1f}s')
+            lines.append(f'  10秒以上の無音: {len(long_silence)}個')
+
+            if len(long_silence) > 0:
+                long_ratios_peak = [s['ratio_peak'] for s in long_silence]
+
+                lines.append(f'  → 10秒以上無音の後の音レベル比率（ピーク）:')
+                lines.append(f'     min={min(long_ratios_peak):.2f}x, max={max(long_ratios_peak):.2f}x, ')
+                lines.append(f'     mean={np.mean(long_ratios_peak):.2f}x, median={np.median(long_ratios_peak):.2f}x')
+                lines.append(f'     p25={np.percentile(long_ratios_peak, 25):.2f}x, p75={np.percentile(long_ratios_peak, 75):.2f}x')
+
+                lines.append(f'  → 10秒以上無音の詳細（最初の5件）:')
+                for i, s in enumerate(long_silence[:5], 1):
+                    lines.append(f'     {i}. {s["start"]:.1f}s-{s["end"]:.1f}s (持続:{s["duration"]:.1f}s, 後の音:{s["ratio_peak"]:.2f}x)')
+
+                if len(long_ratios_peak) >= 3:
+                    recommended_ratio = np.percentile(long_ratios_peak, 75)
+                    lines.append(f'  ★ 推奨パラメータ: 無音閾値={percentile}%tile, 呼吸再開倍率={recommended_ratio:.1f}x')
+
+            lines.append('')
+
+    return lines
+
+
+def test_silence_report_matches_loop(monkeypatch, capsys):
+    """合成したRMS系列（最後まで無音の区間を含む）で元の実装と同じ分析結果を出力"""
+    cfg = audio_simple.SimpleAudioConfig()
+    rng = np.random.default_rng(0)
+    n = 12000  # 10分
+    times = np.arange(n) * cfg.rms_hop
+
+    # 数秒〜数十秒の無音と呼吸音を交互に並べる
+    levels = np.empty(n)
+    pos = 0
+    while pos < n:
+        length = int(rng.integers(20, 600))
+        levels[pos:pos + length] = rng.choice([0.01, 0.05, 0.3, 1.0])
+        pos += length
+    rms = (levels * (0.5 + rng.random(n))).astype(np.float32)
+    rms[-100:] = 0.001
+
+    monkeypatch.setattr(audio_simple, "load_and_preprocess", lambda path, sr: (None, sr))
+    monkeypatch.setattr(audio_simple, "compute_rms_energy", lambda audio, sr, cfg: (times, rms))
+
+    analyze_silence_patterns.analyze_silence_patterns("dummy.mp4")
+
+    output = capsys.readouterr().out.splitlines()
+    report = output[output.index('[4/4] 無音区間パターン分析中...') + 2:output.index('分析完了') - 1]
+
+    expected = _silence_report_loop(times, rms)
+    assert any(line.startswith('  ★') for line in expected)
+    assert report == expected
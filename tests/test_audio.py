@@ -0,0 +1,180 @@
+"""
+音声処理モジュールのテスト
+"""
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# モジュールパスを追加
+sys.path.append(str(Path(__file__).parent.parent))
+
+from services import audio
+
+
+def _detect_apnea_candidates_interp(rms_t, rms, breath_energy_t, breath_energy, cycle_t, cycle_strength, cfg,
+                                    percentile=np.percentile):
+    """detect_apnea_candidates の元の実装（np.interpで時刻を揃える、比較用）"""
+    rms_threshold = percentile(rms, cfg.rms_threshold_percentile)
+    breath_threshold = percentile(breath_energy, cfg.rms_threshold_percentile)
+    cycle_threshold = percentile(cycle_strength, 30)
+
+    is_apnea = (
+        (rms < rms_threshold)
+        & (np.interp(rms_t, breath_energy_t, breath_energy) < breath_threshold)
+        & (np.interp(rms_t, cycle_t, cycle_strength) < cycle_threshold)
+    )
+
+    candidates = []
+    in_apnea = False
+    start_idx = 0
+
+    for i in range(len(is_apnea)):
+        if is_apnea[i] and not in_apnea:
+            in_apnea = True
+            start_idx = i
+        elif not is_apnea[i] and in_apnea:
+            in_apnea = False
+            if rms_t[i] - rms_t[start_idx] >= cfg.apnea_min_duration:
+                candidates.append({"start": float(rms_t[start_idx]), "end": float(rms_t[i]), "confidence": 0.5})
+
+    if in_apnea and rms_t[-1] - rms_t[start_idx] >= cfg.apnea_min_duration:
+        candidates.append({"start": float(rms_t[start_idx]), "end": float(rms_t[-1]), "confidence": 0.5})
+
+    return candidates
+
+
+def _audio_with_quiet_gap(rng, sr):
+    """呼吸音の間に、徐々に音が戻る40秒の静かな区間を挟んだ音声"""
+    t = np.arange(40 * sr) / sr
+    quiet = rng.standard_normal(len(t)) * 1e-4 * 100 ** (t / 40)
+    loud = rng.standard_normal(60 * sr) * 0.5
+    return np.concatenate([loud[:30 * sr], quiet, loud[30 * sr:]]).astype(np.float32)
+
+
+def test_feature_time_grids_match():
+    """RMS・帯域エネルギー・周期強度は同じ時刻配列になる（補間が不要な前提）"""
+    cfg = audio.AudioConfig()
+    sr = cfg.audio_sr
+    rng = np.random.default_rng(0)
+
+    for n_samples in [sr * 3, sr * 5 + 7, 12345]:
+        signal = rng.uniform(-1.0, 1.0, n_samples).astype(np.float32)
+
+        rms_t, _ = audio.short_time_rms(signal, sr, cfg)
+        breath_t, _ = audio.band_energy(signal, sr, [cfg.breath_band], cfg)[f"{cfg.breath_band[0]}-{cfg.breath_band[1]}"]
+        cycle_t, _ = audio.breath_cycle_strength(signal, sr, cfg)
+
+        assert np.array_equal(rms_t, breath_t)
+        assert np.array_equal(rms_t, cycle_t)
+
+
+def test_detect_apnea_candidates_matches_interp():
+    """個別に計算した特徴量で、補間していた元の実装と同じ候補を検出"""
+    cfg = audio.AudioConfig()
+    sr = cfg.audio_sr
+    rng = np.random.default_rng(1)
+
+    for _ in range(3):
+        signal = _audio_with_quiet_gap(rng, sr)
+
+        rms_t, rms = audio.short_time_rms(signal, sr, cfg)
+        breath_t, breath = audio.band_energy(signal, sr, [cfg.breath_band], cfg)[f"{cfg.breath_band[0]}-{cfg.breath_band[1]}"]
+        cycle_t, cycle = audio.breath_cycle_strength(signal, sr, cfg)
+
+        candidates = audio.detect_apnea_candidates(rms_t, rms, breath, cycle, cfg)
+
+        # 閾値は同じ順位ベースのパーセンタイルで比較
+        assert candidates == _detect_apnea_candidates_interp(
+            rms_t, rms, breath_t, breath, cycle_t, cycle, cfg, percentile=audio._pct
+        )
+        # 静かな区間の前半が候補になる
+        assert len(candidates) == 1
+        assert 30.0 <= candidates[0]["start"] < candidates[0]["end"] <= 70.0
+
+
+def _rolling_std_loop(x, window_size):
+    """breath_cycle_strength の元の移動窓標準偏差ループ（比較用）"""
+    cycle_strength = np.zeros_like(x)
+
+    for i in range(len(x)):
+        start_idx = max(0, i - window_size // 2)
+        end_idx = min(len(x), i + window_size // 2)
+        cycle_strength[i] = np.std(x[start_idx:end_idx])
+
+    return cycle_strength
+
+
+def test_rolling_std_matches_loop():
+    """ランダムな系列・端の切り詰めを含めて元の実装と一致"""
+    rng = np.random.default_rng(0)
+    for n in [1, 2, 15, 16, 29, 30, 31, 500]:
+        x = (rng.random(n) ** 3).astype(np.float32)
+
+        result = audio._rolling_std(x, window_size=30)
+
+        assert result.dtype == x.dtype
+        np.testing.assert_allclose(result, _rolling_std_loop(x, 30), rtol=1e-4, atol=1e-6)
+
+
+def test_rolling_std_constant_signal():
+    """一定値の系列では標準偏差がほぼ0（丸め誤差で負の分散になっても NaN にならない）"""
+    x = np.full(100, 0.1, dtype=np.float32)
+
+    result = audio._rolling_std(x, window_size=30)
+
+    assert not np.any(np.isnan(result))
+    np.testing.assert_allclose(result, 0.0, atol=1e-6)
+
+
+def test_downsample_for_plot_keeps_ends_and_peaks():
+    """LTTBで指定点数に間引き、先頭・末尾と孤立したピーク・谷を残す"""
+    rng = np.random.default_rng(2)
+    n = 100_000
+    times = np.arange(n) * 0.01
+    values = (rng.random(n) * 0.1).astype(np.float32)
+    values[12_345] = 5.0   # 孤立したピーク
+    values[67_890] = -5.0  # 孤立した谷
+
+    for max_points in [3, 10, 1000, 5000]:
+        t_out, y_out = audio.downsample_for_plot(times, values, max_points)
+
+        assert len(t_out) == len(y_out) == max_points
+        assert t_out[0] == times[0] and t_out[-1] == times[-1]
+        assert np.all(np.diff(t_out) > 0)
+        if max_points >= 10:
+            assert 5.0 in y_out and -5.0 in y_out
+
+
+def test_lttb_indices_one_point_per_bucket():
+    """インデックスは先頭・末尾を含み、単調増加で重複しない"""
+    rng = np.random.default_rng(3)
+    for n, n_out in [(4, 3), (11, 10), (1001, 7), (5000, 4999)]:
+        times = np.arange(n, dtype=np.float64)
+        values = rng.standard_normal(n)
+
+        indices = audio._lttb_indices(times, values, n_out)
+
+        assert len(indices) == n_out
+        assert indices[0] == 0 and indices[-1] == n - 1
+        assert np.all(np.diff(indices) > 0)
+
+
+def test_downsample_for_plot_passthrough():
+    """点数が上限以下ならそのまま返す"""
+    times = np.arange(100) * 0.01
+    values = np.linspace(0.0, 1.0, 100)
+
+    for max_points in [100, 5000]:
+        t_out, y_out = audio.downsample_for_plot(times, values, max_points)
+
+        assert t_out is times and y_out is values
+
+
+def test_load_and_preprocess_reports_ffmpeg_error(tmp_path):
+    """FFmpegが失敗した場合はstderrの内容を含む例外を送出"""
+    missing_path = str(tmp_path / "missing.mp4")
+
+    with pytest.raises(RuntimeError, match="No such file"):
+        audio.load_and_preprocess(missing_path)
@@ -0,0 +1,140 @@
+"""
+シンプル音声処理モジュールのテスト
+ベクトル化した実装が元のループ実装と同じ結果を返すことを確認
+"""
+import sys
+from pathlib import Path
+
+import librosa
+import numpy as np
+import pytest
+
+# モジュールパスを追加
+sys.path.append(str(Path(__file__).parent.parent))
+
+from services import audio_simple
+
+
+def _detect_apnea_simple_loop(times, rms, cfg):
+    """detect_apnea_simple の元のループ実装（比較用）"""
+    silence_threshold = np.percentile(rms, cfg.silence_threshold_percentile)
+    resume_threshold = silence_threshold * cfg.resume_threshold_multiplier
+
+    is_silence = rms < silence_threshold
+
+    apnea_events = []
+    in_silence = False
+    silence_start_idx = 0
+
+    for i in range(len(is_silence)):
+        if is_silence[i] and not in_silence:
+            in_silence = True
+            silence_start_idx = i
+
+        elif not is_silence[i] and in_silence:
+            in_silence = False
+            silence_start_time = times[silence_start_idx]
+            silence_end_time = times[i]
+            silence_duration = silence_end_time - silence_start_time
+
+            if silence_duration >= cfg.silence_min_duration:
+                check_frames = min(10, len(rms) - i)
+                if check_frames > 0:
+                    resume_peak = np.max(rms[i:i+check_frames])
+
+                    if resume_peak > resume_threshold:
+                        confidence = min(1.0, resume_peak / resume_threshold)
+
+                        apnea_events.append({
+                            "start": float(silence_start_time),
+                            "end": float(silence_end_time),
+                            "duration": float(silence_duration),
+                            "resume_peak": float(resume_peak),
+                            "confidence": float(confidence)
+                        })
+
+    if in_silence:
+        silence_start_time = times[silence_start_idx]
+        silence_end_time = times[-1]
+        silence_duration = silence_end_time - silence_start_time
+
+        if silence_duration >= cfg.silence_min_duration:
+            apnea_events.append({
+                "start": float(silence_start_time),
+                "end": float(silence_end_time),
+                "duration": float(silence_duration),
+                "resume_peak": 0.0,
+                "confidence": 0.5
+            })
+
+    return apnea_events
+
+
+def _synthetic_rms(rng, n, trailing_silence=False):
+    """無音区間と呼吸再開を含むRMS系列を生成"""
+    levels = np.repeat(rng.random(n // 250 + 1) ** 3, 250)[:n]
+    rms = (levels + rng.random(n) * 0.02).astype(np.float32)
+    if trailing_silence:
+        rms[-300:] = 0.001
+    return rms
+
+
+def test_compute_rms_energy_matches_librosa():
+    """librosa.feature.rms（元の実装）と同じフレーム数・時刻・値"""
+    cfg = audio_simple.SimpleAudioConfig()
+    sr = cfg.audio_sr
+    rng = np.random.default_rng(0)
+
+    for n_samples in [sr // 10, sr * 3 + 123]:
+        audio = rng.uniform(-1.0, 1.0, n_samples).astype(np.float32)
+
+        times, rms = audio_simple.compute_rms_energy(audio, sr, cfg)
+
+        win_length = int(cfg.rms_win * sr)
+        hop_length = int(cfg.rms_hop * sr)
+        expected = librosa.feature.rms(y=audio, frame_length=win_length, hop_length=hop_length)[0]
+        expected_times = librosa.frames_to_time(np.arange(len(expected)), sr=sr, hop_length=hop_length)
+
+        assert rms.shape == expected.shape
+        np.testing.assert_allclose(rms, expected, rtol=1e-5, atol=1e-7)
+        np.testing.assert_allclose(times, expected_times)
+
+
+def test_analyze_audio_statistics_matches_numpy():
+    """個別に計算した統計値と一致（算出済みパーセンタイルを渡した場合も同じ）"""
+    rng = np.random.default_rng(1)
+    rms = (rng.random(5000) ** 2).astype(np.float32)
+
+    stats = audio_simple.analyze_audio_statistics(rms)
+
+    assert stats["min"] == float(np.min(rms))
+    assert stats["max"] == float(np.max(rms))
+    # まとめて算出したパーセンタイルはfloat64で補間されるため、個別計算とは丸め誤差の差がある
+    assert stats["median"] == pytest.approx(float(np.median(rms)), rel=1e-6)
+    assert stats["mean"] == pytest.approx(float(np.mean(rms, dtype=np.float64)))
+    assert stats["std"] == pytest.approx(float(np.std(rms, dtype=np.float64)))
+    for p in [10, 25, 30, 50, 75, 90]:
+        assert stats[f"p{p}"] == pytest.approx(float(np.percentile(rms, p)), rel=1e-6)
+
+    percentile_values = dict(zip(audio_simple.STATS_PERCENTILES, np.percentile(rms, audio_simple.STATS_PERCENTILES)))
+    assert audio_simple.analyze_audio_statistics(rms, percentile_values) == stats
+
+
+def test_detect_apnea_simple_matches_loop(capsys):
+    """ランダムなRMS系列（最後まで無音の場合を含む）で元の実装と一致"""
+    cfg = audio_simple.SimpleAudioConfig()
+    rng = np.random.default_rng(2)
+    event_count = 0
+
+    for trial in range(30):
+        n = int(rng.integers(1, 6000))
+        times = np.arange(n) * cfg.rms_hop
+        rms = _synthetic_rms(rng, n, trailing_silence=(trial % 3 == 0))
+
+        events = audio_simple.detect_apnea_simple(times, rms, cfg)
+
+        assert events == _detect_apnea_simple_loop(times, rms, cfg)
+        event_count += len(events)
+
+    # 比較が空振りしていないこと
+    assert event_count > 0
@@ -0,0 +1,138 @@
+"""
+キャリブレーションAPIのテスト
+ベクトル化した実装が元のループ実装と同じ結果を返すことを確認
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# モジュールパスを追加
+sys.path.append(str(Path(__file__).parent.parent))
+
+from api import calibration
+from services.storage import Storage
+
+
+def _marker_stats_loop(times, rms, markers):
+    """calculate_parameters の元のマーク区間ループ（比較用）"""
+    silence_values = []
+    resume_peaks = []
+
+    for start, end in markers:
+        mask = (times >= start) & (times <= end)
+        silence_rms = rms[mask]
+
+        if len(silence_rms) > 0:
+            silence_values.append(np.mean(silence_rms))
+
+            end_idx = np.where(times >= end)[0]
+            if len(end_idx) > 0:
+                start_idx = end_idx[0]
+                check_frames = min(10, len(rms) - start_idx)
+                if check_frames > 0:
+                    resume_peaks.append(np.max(rms[start_idx:start_idx+check_frames]))
+
+    return silence_values, resume_peaks
+
+
+def _ahi_timeline_loop(event_times, total_duration):
+    """calculate_ahi の元のスライディングウィンドウループ（比較用）"""
+    window_size = 3600
+    step_size = 300
+
+    ahi_timeline = []
+    max_ahi = 0.0
+    worst_period_start = 0
+
+    current_time = 0
+    while current_time + window_size <= total_duration:
+        window_start = current_time
+        window_end = current_time + window_size
+
+        events_in_window = np.sum((event_times >= window_start) & (event_times < window_end))
+        ahi = float(events_in_window)
+
+        ahi_timeline.append({
+            "time": float(window_start),
+            "ahi": ahi,
+            "window_start": float(window_start),
+            "window_end": float(window_end)
+        })
+
+        if ahi > max_ahi:
+            max_ahi = ahi
+            worst_period_start = window_start
+
+        current_time += step_size
+
+    return ahi_timeline, max_ahi, worst_period_start
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """一時ディレクトリのストレージに差し替え"""
+    store = Storage(base_dir=str(tmp_path / "storage"))
+    monkeypatch.setattr(calibration, "storage", store)
+    return store
+
+
+def test_calculate_parameters_matches_loop(store, capsys):
+    """マーク区間の無音RMS・再開ピークが元の実装と一致（終端・範囲外のマークを含む）"""
+    job_id = "test-calibration"
+    rng = np.random.default_rng(0)
+    times = np.arange(2000) * 0.05
+    rms = (rng.random(2000) ** 3).astype(np.float32)
+
+    store.create_job(job_id, "/tmp/test.wav", version="test-v1")
+    store.save_rms(job_id, times, rms)
+    store.save_results(job_id, {"job_id": job_id, "duration_sec": float(times[-1]), "sr": 8000})
+
+    markers = [(1.0, 12.0), (20.02, 31.3), (45.0, 45.01), (95.0, 99.95), (99.97, 120.0), (150.0, 160.0)]
+    request = calibration.CalculateRequest(
+        job_id=job_id,
+        markers=[calibration.MarkerInput(start=s, end=e) for s, e in markers]
+    )
+
+    params = asyncio.run(calibration.calculate_parameters(request))
+
+    silence_values, resume_peaks = _marker_stats_loop(times, rms, markers)
+    assert params["silence_values"] == pytest.approx([float(v) for v in silence_values], rel=1e-6)
+    assert params["resume_peaks"] == [float(p) for p in resume_peaks]
+    assert params["silence_threshold"] == pytest.approx(float(np.mean(silence_values)), rel=1e-6)
+    assert params["resume_multiplier"] == pytest.approx(
+        float(np.mean([p / params["silence_threshold"] for p in resume_peaks])), rel=1e-9
+    )
+    assert params["marker_count"] == len(markers)
+
+
+def test_calculate_ahi_matches_loop(store, capsys):
+    """AHI推移・最大AHI・最悪期間が元の実装と一致"""
+    job_id = "test-ahi"
+    rng = np.random.default_rng(1)
+
+    store.create_job(job_id, "/tmp/test.wav", version="test-v1")
+
+    for total_duration in [1800.0, 3600.0, 3899.5, 4 * 3600.0 + 123.4]:
+        store.save_results(job_id, {"job_id": job_id, "duration_sec": total_duration, "sr": 8000})
+
+        # 窓の境界ちょうどのイベントも含める
+        peak_times = list(rng.uniform(0, total_duration, 80)) + [0.0, 300.0, 3600.0]
+        request = calibration.AHICalculationRequest(
+            job_id=job_id,
+            apnea_events=[{"peak_time": t} for t in peak_times]
+        )
+
+        result = asyncio.run(calibration.calculate_ahi(request))
+
+        timeline, max_ahi, worst_period_start = _ahi_timeline_loop(np.sort(peak_times), total_duration)
+        assert result["timeline"] == timeline
+        assert result["max_ahi"] == max_ahi
+        assert result["total_events"] == len(peak_times)
+        assert result["overall_ahi"] == len(peak_times) / (total_duration / 3600)
+        if total_duration >= 3600:
+            assert result["worst_period"]["start_time"] == float(worst_period_start)
+        else:
+            assert result["worst_period"] is None
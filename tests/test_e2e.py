@@ -6,9 +6,9 @@ import pytest
 import sys
 from pathlib import Path
 import numpy as np
-import cv2
 import subprocess
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 # モジュールパスを追加
 sys.path.append(str(Path(__file__).parent.parent))
@@ -18,62 +18,42 @@ from services import audio, video, analyzer, storage
 
 # テスト用の短いダミー動画を生成
 def create_test_video(output_path: str, duration_sec: int = 30, fps: int = 10):
-    """テスト用のダミー動画を生成"""
+    """テスト用のダミー動画を生成（グレー映像＋無音音声をFFmpeg 1回で生成）"""
     width, height = 640, 480
 
-    # VideoWriter準備
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    out = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
+    cmd = [
+        'ffmpeg', '-loglevel', 'error',
+        '-f', 'lavfi', '-i', f'color=c=gray:s={width}x{height}:r={fps}:d={duration_sec}',
+        '-f', 'lavfi', '-i', 'anullsrc=channel_layout=mono:sample_rate=16000',
+        '-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-c:a', 'aac', '-shortest',
+        '-y', output_path
+    ]
 
-    # 音声付き動画生成用に一度フレームだけ書き出し
-    num_frames = duration_sec * fps
+    subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
 
-    for i in range(num_frames):
-        # シンプルなグレーのフレーム
-        frame = np.ones((height, width, 3), dtype=np.uint8) * 128
 
-        # フレーム番号を描画
-        cv2.putText(frame, f"Frame {i}", (50, 240),
-                    cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+@pytest.fixture(scope="session")
+def test_video_path(tmp_path_factory):
+    """テスト動画をセッションで1回だけ生成して共有"""
+    path = tmp_path_factory.mktemp("video") / "test_sleep_video.mp4"
+    create_test_video(str(path), duration_sec=30, fps=10)
+    return str(path)
 
-        out.write(frame)
 
-    out.release()
+@pytest.fixture(scope="session")
+def analysis_results(test_video_path):
+    """テスト動画の解析結果をセッションで1回だけ計算して共有"""
+    return analyzer.analyze(test_video_path, analyzer.AnalysisConfig())
 
-    # FFmpegで無音の音声トラックを追加
-    temp_path = output_path + ".temp.mp4"
-    cmd = [
-        'ffmpeg', '-i', output_path,
-        '-f', 'lavfi', '-i', 'anullsrc=channel_layout=mono:sample_rate=16000',
-        '-c:v', 'copy', '-c:a', 'aac', '-shortest',
-        '-y', temp_path
-    ]
-
-    try:
-        subprocess.run(cmd, capture_output=True, check=True)
-        # 元のファイルを置き換え
-        Path(output_path).unlink()
-        Path(temp_path).rename(output_path)
-    except Exception as e:
-        print(f"警告: 音声追加に失敗しました ({e})")
 
-
-def test_video_creation():
+def test_video_creation(test_video_path):
     """テスト動画の生成確認"""
-    test_video_path = "/tmp/test_sleep_video.mp4"
-    create_test_video(test_video_path, duration_sec=30, fps=10)
-
     assert Path(test_video_path).exists()
     print(f"✓ テスト動画作成成功: {test_video_path}")
 
 
-def test_video_metadata():
+def test_video_metadata(test_video_path):
     """動画メタデータ取得テスト"""
-    test_video_path = "/tmp/test_sleep_video.mp4"
-
-    if not Path(test_video_path).exists():
-        create_test_video(test_video_path, duration_sec=30, fps=10)
-
     metadata = video.get_video_metadata(test_video_path)
 
     assert metadata["duration"] > 0
@@ -84,13 +64,8 @@ def test_video_metadata():
     print(f"✓ メタデータ取得成功: {metadata}")
 
 
-def test_audio_extraction():
+def test_audio_extraction(test_video_path):
     """音声抽出テスト"""
-    test_video_path = "/tmp/test_sleep_video.mp4"
-
-    if not Path(test_video_path).exists():
-        create_test_video(test_video_path, duration_sec=30, fps=10)
-
     audio_data, sr = audio.load_and_preprocess(test_video_path, target_sr=16000)
 
     assert len(audio_data) > 0
@@ -99,35 +74,83 @@ def test_audio_extraction():
     print(f"✓ 音声抽出成功: {len(audio_data)} サンプル, SR={sr}")
 
 
-def test_frame_extraction():
+def test_frame_extraction(test_video_path):
     """フレーム抽出テスト"""
-    test_video_path = "/tmp/test_sleep_video.mp4"
-
-    if not Path(test_video_path).exists():
-        create_test_video(test_video_path, duration_sec=30, fps=10)
-
     frame = video.extract_frame_at_time(test_video_path, 5.0)
 
     assert frame is not None
     assert frame.shape[0] > 0
     assert frame.shape[1] > 0
 
-    print(f"✓ フレーム抽出成功: {frame.shape}")
+    # JPEGエンコード（/frame エンドポイントと同じ経路）
+    jpeg = video.encode_frame_to_jpeg(frame)
+    assert jpeg[:2] == b"\xff\xd8"
+
+    print(f"✓ フレーム抽出成功: {frame.shape}, JPEG {len(jpeg)} bytes")
 
 
-def test_analysis_pipeline():
-    """解析パイプライン全体のテスト"""
-    test_video_path = "/tmp/test_sleep_video.mp4"
+def test_frame_extraction_after_eviction(test_video_path, tmp_path):
+    """キャッシュから外されて閉じたVideoCaptureを掴んでいても開き直して抽出できる"""
+    reader = video._get_reader(test_video_path)
 
-    if not Path(test_video_path).exists():
-        create_test_video(test_video_path, duration_sec=30, fps=10)
+    # 別パスの動画を開いてキャッシュから溢れさせる
+    for i in range(video.READER_CACHE_SIZE):
+        other_path = tmp_path / f"other_{i}.mp4"
+        other_path.symlink_to(test_video_path)
+        assert video._get_reader(str(other_path)) is not None
 
+    assert reader.closed
+    assert video.extract_frame_at_time(test_video_path, 5.0) is not None
+
+    for i in range(video.READER_CACHE_SIZE):
+        video.release_reader(str(tmp_path / f"other_{i}.mp4"))
+
+
+def test_get_reader_concurrent_open(test_video_path, tmp_path):
+    """同じ動画を複数スレッドで同時に開いてもキャッシュされるのは1つだけ"""
+    video_path = tmp_path / "concurrent.mp4"
+    video_path.symlink_to(test_video_path)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        readers = list(pool.map(lambda _: video._get_reader(str(video_path)), range(8)))
+
+    assert all(reader is readers[0] for reader in readers)
+    assert not readers[0].closed
+    assert video.extract_frame_at_time(str(video_path), 5.0) is not None
+
+    video.release_reader(str(video_path))
+
+
+def test_compute_motion_signals_matches_separate_passes(tmp_path):
+    """1回のデコードで求めた動き量が motion_series / calculate_chest_motion と一致"""
+    # 動きのある映像（testsrc）で比較する
+    video_path = str(tmp_path / "moving.mp4")
+    subprocess.run([
+        'ffmpeg', '-loglevel', 'error',
+        '-f', 'lavfi', '-i', 'testsrc=size=320x240:rate=10:duration=10',
+        '-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-y', video_path
+    ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+
+    for use_dense_flow in [False, True]:
+        signals = video.compute_motion_signals(video_path, use_dense_flow=use_dense_flow)
+
+        whole_t, whole_motion = video.motion_series(video_path, use_dense_flow=use_dense_flow)
+        roi_t, roi_motion = video.calculate_chest_motion(video_path)
+
+        assert len(whole_motion) > 0 and np.any(whole_motion > 0)
+        np.testing.assert_array_equal(signals["whole_t"], whole_t)
+        np.testing.assert_allclose(signals["whole_motion"], whole_motion, rtol=1e-6)
+        np.testing.assert_array_equal(signals["roi_t"], roi_t)
+        np.testing.assert_allclose(signals["roi_motion"], roi_motion, rtol=1e-6)
+
+
+def test_analysis_pipeline(analysis_results):
+    """解析パイプライン全体のテスト"""
     print("\n" + "="*60)
     print("解析パイプライン実行テスト")
     print("="*60)
 
-    cfg = analyzer.AnalysisConfig()
-    results = analyzer.analyze(test_video_path, cfg)
+    results = analysis_results
 
     assert results.duration_sec > 0
     assert results.sr > 0
@@ -147,9 +170,9 @@ def test_analysis_pipeline():
     print("✓ 解析パイプラインテスト成功")
 
 
-def test_storage():
+def test_storage(tmp_path):
     """ストレージ機能テスト"""
-    store = storage.Storage(base_dir="/tmp/test_sleep_storage")
+    store = storage.Storage(base_dir=str(tmp_path / "storage"))
 
     # ダミーデータで保存テスト
     job_id = "test-job-123"
@@ -179,32 +202,53 @@ def test_storage():
     assert loaded is not None
     assert loaded["duration_sec"] == 30.0
 
+    # 同じジョブを再保存してもイベント行が重複しない
+    test_results["events"] = [{"type": "apnea", "start": 1.0, "end": 12.0, "confidence": 0.8}]
+    store.save_results(job_id, test_results)
+    store.save_results(job_id, test_results)
+    with store._cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM events WHERE job_id = ?", (job_id,))
+        assert cursor.fetchone()[0] == 1
+
+    # 候補ピーク位置は結果JSONとは別ファイルに保存
+    store.save_peaks(job_id, np.array([3, 7, 11]), np.array([7, 3]))
+    peaks, top_peaks = store.load_peaks(job_id)
+    assert peaks.tolist() == [3, 7, 11]
+    assert top_peaks.tolist() == [7, 3]
+    assert "peak_indices" not in store.load_results(job_id)
+
+    # RMSはfloat32のまま保存され、時刻はfloat64で読み込める
+    times = np.arange(5) * 0.01
+    rms = np.linspace(0.0, 1.0, 5, dtype=np.float32)
+    store.save_rms(job_id, times, rms)
+    loaded_t, loaded_rms = store.load_rms(job_id)
+    assert loaded_t.dtype == np.float64 and loaded_rms.dtype == np.float32
+    assert np.array_equal(loaded_t, times) and np.array_equal(loaded_rms, rms)
+    assert not list(store.results_dir.glob("*.tmp"))
+
     print("✓ ストレージテスト成功")
 
 
-def test_full_e2e():
+def test_full_e2e(test_video_path, analysis_results, tmp_path):
     """フルE2Eテスト (動画作成→解析→保存→読み込み)"""
     print("\n" + "="*60)
     print("フルE2Eテスト開始")
     print("="*60 + "\n")
 
-    # 1. テスト動画作成
-    test_video_path = "/tmp/test_sleep_e2e.mp4"
-    print("[1/5] テスト動画作成中...")
-    create_test_video(test_video_path, duration_sec=30, fps=10)
-    print(f"  ✓ 作成完了: {test_video_path}")
+    # 1. テスト動画（セッションで共有）
+    print("[1/5] テスト動画準備...")
+    print(f"  ✓ 準備完了: {test_video_path}")
 
-    # 2. 解析実行
-    print("\n[2/5] 解析実行中...")
-    cfg = analyzer.AnalysisConfig()
-    results = analyzer.analyze(test_video_path, cfg)
+    # 2. 解析結果（セッションで共有）
+    print("\n[2/5] 解析結果取得...")
+    results = analysis_results
     print(f"  ✓ 解析完了")
 
     # 3. ストレージ保存
     print("\n[3/5] 結果保存中...")
-    store = storage.Storage(base_dir="/tmp/test_sleep_e2e_storage")
+    store = storage.Storage(base_dir=str(tmp_path / "e2e_storage"))
     job_id = "e2e-test-job"
-    store.create_job(job_id, test_video_path, cfg.version)
+    store.create_job(job_id, test_video_path, results.version)
     store.save_results(job_id, results.to_dict())
     print(f"  ✓ 保存完了: ジョブID={job_id}")
 
@@ -218,9 +262,8 @@ def test_full_e2e():
     print("\n[5/5] フレーム取得中...")
     frame = video.extract_frame_at_time(test_video_path, 5.0)
     assert frame is not None
-    jpeg = video.encode_frame_to_jpeg(frame)
-    assert len(jpeg) > 0
-    print(f"  ✓ フレーム取得完了: {len(jpeg)} bytes")
+    assert frame.size > 0
+    print(f"  ✓ フレーム取得完了: {frame.shape}")
 
     print("\n" + "="*60)
     print("フルE2Eテスト成功！")
@@ -0,0 +1,145 @@
+"""
+融合判定モジュールのテスト
+ベクトル化した実装が元のループ実装と同じ結果を返すことを確認
+"""
+import random
+import sys
+from pathlib import Path
+
+import numpy as np
+
+# モジュールパスを追加
+sys.path.append(str(Path(__file__).parent.parent))
+
+from services import fusion
+
+
+def _refine_with_motion_loop(apnea_candidates, motion_t, motion, motion_threshold_percentile=20):
+    """refine_with_motion の元のループ実装（比較用）"""
+    if len(motion_t) == 0 or len(motion) == 0:
+        return apnea_candidates
+
+    motion_threshold = np.percentile(motion, motion_threshold_percentile)
+
+    refined_events = []
+
+    for candidate in apnea_candidates:
+        start = candidate["start"]
+        end = candidate["end"]
+
+        mask = (motion_t >= start) & (motion_t <= end)
+        motion_in_range = motion[mask]
+
+        if len(motion_in_range) == 0:
+            refined_events.append(candidate)
+            continue
+
+        avg_motion = np.mean(motion_in_range)
+
+        if avg_motion < motion_threshold:
+            new_confidence = min(1.0, candidate["confidence"] + 0.3)
+
+            refined_events.append({
+                "start": candidate["start"],
+                "end": candidate["end"],
+                "confidence": new_confidence
+            })
+        else:
+            new_confidence = max(0.0, candidate["confidence"] - 0.2)
+
+            if new_confidence >= 0.3:
+                refined_events.append({
+                    "start": candidate["start"],
+                    "end": candidate["end"],
+                    "confidence": new_confidence
+                })
+
+    return refined_events
+
+
+def _merge_nearby_events_loop(events, max_gap=2.0):
+    """merge_nearby_events の元のループ実装（比較用）"""
+    if len(events) == 0:
+        return []
+
+    sorted_events = sorted(events, key=lambda x: x["start"])
+
+    merged = []
+    current = sorted_events[0].copy()
+
+    for event in sorted_events[1:]:
+        gap = event["start"] - current["end"]
+
+        if gap <= max_gap:
+            current["end"] = event["end"]
+            current["confidence"] = (current["confidence"] + event["confidence"]) / 2
+        else:
+            merged.append(current)
+            current = event.copy()
+
+    merged.append(current)
+
+    return merged
+
+
+def test_refine_with_motion_random():
+    """ランダムな候補・動き量で元の実装と一致（動き量のない区間・境界一致を含む）"""
+    rng = np.random.default_rng(0)
+    for _ in range(50):
+        motion_t = np.arange(int(rng.integers(1, 300)), dtype=np.float64)
+        motion = rng.random(len(motion_t))
+
+        candidates = []
+        for _ in range(int(rng.integers(0, 30))):
+            # 整数時刻で始まる候補を混ぜて、区間端と動き量の時刻が一致する場合も確認
+            start = float(rng.integers(0, 320)) if rng.random() < 0.5 else rng.uniform(0, 320)
+            candidates.append({"start": start, "end": start + rng.uniform(0, 15), "confidence": rng.random()})
+
+        refined = fusion.refine_with_motion(candidates, motion_t, motion)
+
+        assert refined == _refine_with_motion_loop(candidates, motion_t, motion)
+
+
+def test_refine_with_motion_no_motion():
+    """動き量データがない場合は候補をそのまま返す"""
+    candidates = [{"start": 0.0, "end": 10.0, "confidence": 0.5}]
+
+    assert fusion.refine_with_motion(candidates, np.array([]), np.array([])) == candidates
+
+
+def test_merge_nearby_events_overlapping_and_nested():
+    """重なり・入れ子のイベントで元の実装と一致"""
+    events = [
+        {"type": "apnea", "start": 10.0, "end": 20.0, "confidence": 0.5},
+        {"type": "apnea", "start": 0.0, "end": 5.0, "confidence": 0.9},
+        {"type": "apnea", "start": 6.0, "end": 8.0, "confidence": 0.3},
+        {"type": "apnea", "start": 12.0, "end": 15.0, "confidence": 1.0},  # 入れ子
+        {"type": "apnea", "start": 16.5, "end": 18.0, "confidence": 0.2},
+        {"type": "apnea", "start": 30.0, "end": 31.0, "confidence": 0.1},
+        {"type": "apnea", "start": 30.0, "end": 40.0, "confidence": 0.7},  # 同じ開始時刻
+    ]
+
+    merged = fusion.merge_nearby_events(events)
+
+    assert merged == _merge_nearby_events_loop(events)
+    # 入れ子のイベントで終わるグループは、最後に統合したイベントの終了時刻になる
+    assert merged[0]["end"] == 18.0
+    assert merged[1]["end"] == 40.0
+
+
+def test_merge_nearby_events_random():
+    """ランダムなイベント列で元の実装と一致"""
+    rng = random.Random(0)
+    for _ in range(50):
+        events = []
+        for _ in range(rng.randint(0, 40)):
+            start = rng.uniform(0, 300)
+            events.append({"start": start, "end": start + rng.uniform(0, 20), "confidence": rng.random()})
+        max_gap = rng.choice([0.0, 1.0, 2.0, 5.0])
+
+        assert fusion.merge_nearby_events(events, max_gap) == _merge_nearby_events_loop(events, max_gap)
+
+
+def test_merge_nearby_events_empty():
+    """空リスト"""
+    assert fusion.merge_nearby_events([]) == []